@@ -0,0 +1,112 @@
+# -*- encoding: utf-8 -*-
+# Copyright: Armin Leuprecht <mir@mur.at> and Stephan Burger <stephan101@gmx.de>
+# License: GNU GPL version 3; http://www.gnu.org/licenses/gpl.txt
+
+"""
+micro-benchmark of the struct codec against the former bitstring codec
+
+usage: python -m benchmarks.codec [-n NUMBER]
+"""
+
+# Standard Library
+import argparse
+import timeit
+
+from time import time
+
+# First party
+from telescope_server import codec
+from telescope_server.protocol import command
+
+try:
+    # Third party
+    from bitstring import ConstBitStream
+except ImportError:
+    ConstBitStream = None
+
+
+def bitstring_pack(ra, dec):
+    """
+    the former packing of the current position
+    """
+    ra_s, dec_s = codec.coords2stellarium(ra, dec)
+    localtime = ConstBitStream(f"int:64={int(1e6*time())}")
+    sdata = ConstBitStream("0x1800") + ConstBitStream("0x0000")
+    sdata += ConstBitStream(intle=localtime.intle, length=64)
+    sdata += ConstBitStream(uintle=ra_s, length=32)
+    sdata += ConstBitStream(intle=dec_s, length=32)
+    sdata += ConstBitStream(intle=0, length=32)
+    return sdata.bytes
+
+
+def bitstring_goto(data0):
+    """
+    the former decoding of a goto message
+    """
+    data = ConstBitStream(bytes=data0, length=160)
+    data.read("intle:16")
+    data.read("intle:16")
+    data.read("intle:64")
+    ant_pos = data.bitpos
+    data.read("hex:32")
+    data.bitpos = ant_pos
+    ra_uint = data.read("uintle:32")
+    ant_pos = data.bitpos
+    data.read("hex:32")
+    data.bitpos = ant_pos
+    dec_int = data.read("intle:32")
+    return codec.stellarium2coords(ra_uint, dec_int)
+
+
+def bitstring_status(data0):
+    """
+    the former decoding of a status request
+    """
+    data = ConstBitStream(bytes=data0, length=160)
+    data.read("intle:16")
+    data.read("intle:16")
+    return data.read("intle:16")
+
+
+def struct_goto(data0):
+    _, args = codec.decode(data0)
+    return codec.stellarium2coords(*args[1:])
+
+
+def struct_status(data0):
+    return codec.decode(data0)[1][0]
+
+
+def run(number):
+    encoder = codec.PositionEncoder()
+    goto = codec.encode(command.STELLARIUM, 0, *codec.coords2stellarium(5.5, 22.0))
+    status = codec.encode(command.STATUS, 2)
+    cases = [
+        (
+            "pack position",
+            lambda: encoder.encode(5.5, 22.0),
+            lambda: bitstring_pack(5.5, 22.0),
+        ),
+        ("decode goto", lambda: struct_goto(goto), lambda: bitstring_goto(goto)),
+        (
+            "decode status",
+            lambda: struct_status(status),
+            lambda: bitstring_status(status),
+        ),
+    ]
+    print(f"{'':16}{'struct':>12}{'bitstring':>12}  (µs per call)")
+    for name, struct_case, bitstring_case in cases:
+        result = [timeit.timeit(struct_case, number=number) / number * 1e6]
+        if ConstBitStream is not None:
+            if bitstring_case() != struct_case() and name != "pack position":
+                raise AssertionError(f"{name}: results differ")
+            result.append(timeit.timeit(bitstring_case, number=number) / number * 1e6)
+        print(f"{name:16}" + "".join(f"{value:12.2f}" for value in result))
+    if ConstBitStream is None:
+        print("bitstring is not installed, no comparison")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", "--number", type=int, default=20000)
+    run(parser.parse_args().number)
@@ -0,0 +1,335 @@
+# -*- encoding: utf-8 -*-
+# Copyright: Armin Leuprecht <mir@mur.at> and Stephan Burger <stephan101@gmx.de>
+# License: GNU GPL version 3; http://www.gnu.org/licenses/gpl.txt
+
+"""
+load generator of many concurrent Stellarium and GUI clients
+
+Stellarium clients send goto commands and receive the position pushes,
+GUI clients send goto, status and manual step commands; the latency of
+every command, the rate of the pushes and the CPU load of the server are
+measured, and a GUI client that stays idle before its first command checks
+that its response is not garbled by the positions pushed meanwhile;
+unless an address is given the server is started on the dummy controller
+(no hardware needed) and the results are written as JSON
+
+usage: python -m benchmarks.load [--stellarium N] [--gui N] [--duration S]
+"""
+
+# Standard Library
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+from statistics import mean, pstdev
+from threading import Event, Thread
+
+# First party
+from telescope_server import codec
+from telescope_server.framing import ResponseDecoder
+from telescope_server.protocol import command, status
+
+# size of a position message pushed to the Stellarium clients
+POSITION_SIZE = len(codec.PositionEncoder().encode(0.0, 0.0))
+# status codes requested by the GUI clients
+STATUS_CODES = [status.RADEC, status.AZALT, status.TRACKING, status.MOTORRUN]
+
+
+def _goto():
+    return codec.encode(
+        command.STELLARIUM,
+        0,
+        *codec.coords2stellarium(random.uniform(0, 24), random.uniform(-90, 90)),
+    )
+
+
+def _message(name):
+    """
+    return the message of a GUI command
+    """
+    if name == "goto":
+        return _goto()
+    if name == "step":
+        return codec.encode(
+            command.MAKE_STEP, random.randint(-100, 100), random.randint(-100, 100)
+        )
+    return codec.encode(command.STATUS, random.choice(STATUS_CODES))
+
+
+def _paced(rate, stop):
+    """
+    yield the send times of a client at the given rate (with random phase)
+    until stop is set
+    """
+    period = 1.0 / rate
+    deadline = time.perf_counter() + random.uniform(0, period)
+    while not stop.is_set():
+        wait = deadline - time.perf_counter()
+        if wait > 0:
+            time.sleep(wait)
+        yield
+        deadline += period
+
+
+def stellarium_client(address, rate, stop, result):
+    """
+    send goto commands at the given rate and record the arrival times of the
+    position pushes
+    """
+    arrivals = result.setdefault("arrivals", [])
+    period = 1.0 / rate
+    deadline = time.perf_counter() + random.uniform(0, period)
+    pending = 0
+    with socket.create_connection(address) as sock:
+        # keep receiving while waiting for the next goto, so that the
+        # pushes are timed when they arrive
+        sock.settimeout(0.01)
+        while not stop.is_set():
+            if time.perf_counter() >= deadline:
+                sock.sendall(_goto())
+                deadline += period
+            try:
+                data = sock.recv(4096)
+            except socket.timeout:
+                continue
+            if not data:
+                return
+            now = time.perf_counter()
+            pending += len(data)
+            while pending >= POSITION_SIZE:
+                pending -= POSITION_SIZE
+                arrivals.append(now)
+
+
+def gui_client(address, rate, mix, stop, result):
+    """
+    send commands chosen by the weights of mix at the given rate; commands
+    without response are followed by a status request whose response marks
+    their completion
+    """
+    names, weights = zip(*mix.items())
+    latencies = result.setdefault("latencies", {name: [] for name in names})
+    followup = codec.encode(command.STATUS, status.MOTORRUN)
+    decoder = ResponseDecoder()
+    with socket.create_connection(address) as sock:
+        for _ in _paced(rate, stop):
+            name = random.choices(names, weights)[0]
+            message = _message(name)
+            if name != "status":
+                message += followup
+            start = time.perf_counter()
+            sock.sendall(message)
+            responses = []
+            while not responses:
+                data = sock.recv(4096)
+                if not data:
+                    return
+                responses = [
+                    payload
+                    for mtype, payload in decoder.feed(data)
+                    if mtype != command.STELLARIUM
+                ]
+            latencies[name].append(time.perf_counter() - start)
+
+
+def idle_client(address, wait):
+    """
+    stay idle for wait seconds after connecting (like a GUI waiting for its
+    user), then request a status; return the number of positions received
+    before the response and whether the response came intact
+    """
+    decoder = ResponseDecoder()
+    positions = 0
+    with socket.create_connection(address) as sock:
+        time.sleep(wait)
+        sock.sendall(codec.encode(command.STATUS, status.TRACKING))
+        while True:
+            data = sock.recv(4096)
+            if not data:
+                return {"positions": positions, "response_ok": False}
+            for mtype, payload in decoder.feed(data):
+                if mtype == command.STELLARIUM:
+                    positions += 1
+                    continue
+                try:
+                    payload.decode()
+                except UnicodeDecodeError:
+                    return {"positions": positions, "response_ok": False}
+                return {"positions": positions, "response_ok": mtype == command.STATUS}
+
+
+def _cpu_seconds(pid):
+    """
+    return the CPU time of the given process (None where /proc is missing)
+    """
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def _percentiles(values):
+    if not values:
+        return {}
+    values = sorted(values)
+    return {
+        "count": len(values),
+        "p50_ms": values[len(values) // 2] * 1e3,
+        "p90_ms": values[int(len(values) * 0.9)] * 1e3,
+        "p99_ms": values[int(len(values) * 0.99)] * 1e3,
+        "max_ms": values[-1] * 1e3,
+    }
+
+
+def _start_server(port, server, push_rate):
+    """
+    start the daemon on the dummy controller and wait until it listens
+    """
+    env = dict(os.environ, GPIOZERO_PIN_FACTORY="mock")
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "telescope_server.daemon",
+            "--host",
+            "127.0.0.1",
+            "--port",
+            str(port),
+            "--controller",
+            "telescope_server.dummy_controller",
+            "--server",
+            server,
+            "--push-rate",
+            str(push_rate),
+        ],
+        env=env,
+    )
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port)).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("server did not start")
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def run(args):
+    process = None
+    if args.address:
+        host, port = args.address.rsplit(":", 1)
+        address = (host, int(port))
+    else:
+        address = ("127.0.0.1", _free_port())
+        process = _start_server(address[1], args.server, args.push_rate)
+
+    mix = {
+        "status": args.status_weight,
+        "goto": args.goto_weight,
+        "step": args.step_weight,
+    }
+    stop = Event()
+    results = [{} for _ in range(args.stellarium + args.gui)]
+    clients = [
+        Thread(
+            target=stellarium_client,
+            args=[address, args.goto_rate, stop, results[i]],
+            daemon=True,
+        )
+        for i in range(args.stellarium)
+    ] + [
+        Thread(
+            target=gui_client,
+            args=[address, args.rate, mix, stop, results[args.stellarium + i]],
+            daemon=True,
+        )
+        for i in range(args.gui)
+    ]
+    try:
+        for client in clients:
+            client.start()
+        cpu = process and _cpu_seconds(process.pid)
+        start = time.perf_counter()
+        time.sleep(args.duration)
+        stop.set()
+        elapsed = time.perf_counter() - start
+        if cpu is not None:
+            cpu = (_cpu_seconds(process.pid) - cpu) / elapsed
+        for client in clients:
+            client.join(5)
+        # long enough for at least one push
+        idle = idle_client(address, 1.5 / args.push_rate)
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+
+    latencies = {}
+    for result in results[args.stellarium :]:
+        for name, values in result.get("latencies", {}).items():
+            latencies.setdefault(name, []).extend(values)
+    intervals = []
+    for result in results[: args.stellarium]:
+        arrivals = result.get("arrivals", [])
+        intervals += [b - a for a, b in zip(arrivals, arrivals[1:])]
+    return {
+        "server": args.address or args.server,
+        "stellarium_clients": args.stellarium,
+        "gui_clients": args.gui,
+        "seconds": elapsed,
+        "commands_per_second": sum(len(v) for v in latencies.values()) / elapsed,
+        "latency": {name: _percentiles(v) for name, v in latencies.items()},
+        "push": {
+            "expected_rate": args.push_rate,
+            "rate": 1 / mean(intervals) if intervals else 0.0,
+            "interval_jitter_ms": pstdev(intervals) * 1e3 if intervals else 0.0,
+            "worst_interval_ms": max(intervals, default=0.0) * 1e3,
+        },
+        "server_cpu": cpu,
+        "idle_gui": idle,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--address", help="HOST:PORT of a running server (else start one)"
+    )
+    parser.add_argument(
+        "--server", choices=["threading", "asyncio"], default="threading"
+    )
+    parser.add_argument("--push-rate", type=float, default=2.0)
+    parser.add_argument("--stellarium", type=int, default=4, help="Stellarium clients")
+    parser.add_argument("--gui", type=int, default=4, help="GUI clients")
+    parser.add_argument(
+        "--goto-rate", type=float, default=0.5, help="gotos per Stellarium client/s"
+    )
+    parser.add_argument(
+        "--rate", type=float, default=20.0, help="commands per GUI client/s"
+    )
+    parser.add_argument("--status-weight", type=float, default=8)
+    parser.add_argument("--goto-weight", type=float, default=1)
+    parser.add_argument("--step-weight", type=float, default=1)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("-o", "--output", help="write the results to this file")
+    args = parser.parse_args()
+    results = run(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
@@ -0,0 +1,283 @@
+# -*- encoding: utf-8 -*-
+# Copyright: Armin Leuprecht <mir@mur.at> and Stephan Burger <stephan101@gmx.de>
+# License: GNU GPL version 3; http://www.gnu.org/licenses/gpl.txt
+
+"""
+benchmark of the motion of the telescope
+
+measures the step rate and timing jitter of the gpio pulse backend on the
+mock pin factory of gpiozero, the slew time of standard goto distances and
+the tracking error over a simulated hour on the simulated controller and
+the throughput of the request handler; the results are written as JSON and
+can be compared with the results of another version
+
+usage: python -m benchmarks.motion [-o FILE] [--compare FILE] [--quick]
+"""
+
+# Standard Library
+import argparse
+import json
+import platform
+import socket
+import subprocess
+import sys
+import time
+
+from array import array
+from datetime import datetime
+from math import cos, sqrt
+from statistics import mean, pstdev
+from threading import Thread
+
+# Third party
+import ephem
+
+from gpiozero import Device
+from gpiozero.pins.mock import MockFactory
+
+# First party
+from telescope_server import codec, dummy_controller, simulated_controller
+from telescope_server.framing import ResponseDecoder
+from telescope_server.handler import TelescopeRequestHandler, TelescopeServer
+from telescope_server.motor import Motor
+from telescope_server.planner import Move, drive
+from telescope_server.protocol import command, status
+from telescope_server.pulse import GpioBackend
+
+# observer of the simulated sky
+LOCATION = (16.37, 48.21, 170)
+
+
+def step_rate(rates, seconds):
+    """
+    send trains of constant step rates by the gpio backend on mock pins and
+    return the achieved rate and the jitter of the step periods
+    """
+    Device.pin_factory = MockFactory()
+    motor = Motor("Bench", [15, 14, 8], backend=GpioBackend())
+    motor.steps_per_rev = 1293009
+    pin = Device.pin_factory.pin(motor.PUL)
+    results = []
+    for rate in rates:
+        steps = int(rate * seconds)
+        delay = int(1e9 / rate)
+        pin.clear_states()
+        start = time.perf_counter()
+        drive([Move(motor, steps, True, array("q", [delay]) * steps)])
+        elapsed = time.perf_counter() - start
+        # periods between the rising edges of the pulses
+        edges, now = [], 0.0
+        for change in pin.states[1:]:
+            now += change.timestamp
+            if change.state:
+                edges.append(now)
+        periods = [b - a for a, b in zip(edges, edges[1:])]
+        results.append(
+            {
+                "requested": rate,
+                "achieved": steps / elapsed,
+                "jitter_us": pstdev(periods) * 1e6 if periods else 0.0,
+                "worst_period_us": max(periods, default=0.0) * 1e6,
+                "worst_late_us": motor.worst_late * 1e6,
+            }
+        )
+    Device.pin_factory.close()
+    return results
+
+
+def slew_time(distances):
+    """
+    slew both axes by the given distances (degrees, the altitude by half)
+    and return the simulated duration and the CPU time of planning and
+    simulating it
+    """
+    controller = simulated_controller.Controller(speed=0)
+    results = []
+    for distance in distances:
+        for motor in controller.motors:
+            motor.angle = 0
+        angles = [distance % 360, distance / 2 % 360]
+        begin, cpu = controller.clock.now(), time.process_time()
+        controller._executor.move_to(angles).result()
+        results.append(
+            {
+                "distance": distance,
+                "seconds": (controller.clock.now() - begin) * 1e-9,
+                "cpu_seconds": time.process_time() - cpu,
+                "error_steps": [
+                    motor.target_steps(angle)[0]
+                    for motor, angle in zip(controller.motors, angles)
+                ],
+            }
+        )
+    return results
+
+
+class _TrackingController(simulated_controller.Controller):
+    """
+    simulated controller that samples the pointing error at every tick
+    """
+
+    def __init__(self):
+        super().__init__(speed=0)
+        self.samples = []
+
+    def _target_angles(self):
+        az, alt = self._target_cache(
+            ephem.Date(self._utcnow()),
+            (self._target._ra, self._target._dec) + self._observer_key(),
+        )
+        self.samples.append(
+            (
+                self.clock.now(),
+                (self.motors[0].angle - az / ephem.degree + 180) % 360 - 180,
+                self.motors[1].angle - alt / ephem.degree,
+                alt,
+            )
+        )
+        return super()._target_angles()
+
+
+def tracking_error(seconds):
+    """
+    track a target for the given simulated seconds and return the RMS
+    pointing error and the CPU time per tracked second
+    """
+    controller = _TrackingController()
+    controller.set_observer(*LOCATION)
+    # a target half way up in the south east at the start
+    controller._observer.date = controller._utcnow()
+    ra, dec = controller._observer.radec_of(135 * ephem.degree, 45 * ephem.degree)
+    controller._target._ra, controller._target._dec = ra, dec
+    controller.motors[0].angle, controller.motors[1].angle = 135, 45
+
+    start, cpu = controller.clock.now(), time.process_time()
+    controller._start_tracking()
+    while controller.clock.now() - start < seconds * 1e9:
+        time.sleep(0.01)
+    controller._stop_tracking()
+    cpu = time.process_time() - cpu
+    tracked = (controller.clock.now() - start) * 1e-9
+
+    samples = [s for s in controller.samples if s[0] - start <= seconds * 1e9]
+    # the azimuth error on the sky shrinks with the altitude
+    az = [err * cos(alt) * 3600 for _, err, _, alt in samples]
+    alt = [err * 3600 for _, _, err, _ in samples]
+    return {
+        "seconds": tracked,
+        "ticks": len(samples),
+        "rms_az_arcsec": sqrt(mean(e * e for e in az)),
+        "rms_alt_arcsec": sqrt(mean(e * e for e in alt)),
+        "worst_arcsec": max(sqrt(a * a + b * b) for a, b in zip(az, alt)),
+        "cpu_ms_per_second": cpu / tracked * 1e3,
+    }
+
+
+def throughput(messages):
+    """
+    send pipelined status requests to the threading server on the dummy
+    controller and return the handled messages per second
+    """
+    server = TelescopeServer(
+        ("127.0.0.1", 0), dummy_controller.Controller(), TelescopeRequestHandler
+    )
+    Thread(target=server.serve_forever, daemon=True).start()
+    request = codec.encode(command.STATUS, status.RADEC) * messages
+    with socket.create_connection(server.server_address) as sock:
+        start = time.perf_counter()
+        sock.sendall(request)
+        decoder = ResponseDecoder()
+        received = 0
+        while received < messages:
+            data = sock.recv(65536)
+            if not data:
+                break
+            received += sum(
+                mtype != command.STELLARIUM for mtype, _ in decoder.feed(data)
+            )
+        elapsed = time.perf_counter() - start
+    server.shutdown()
+    server.server_close()
+    return {"messages": received, "per_second": received / elapsed}
+
+
+def version():
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run(quick=False):
+    return {
+        "version": version(),
+        "date": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "step_rate": step_rate([500, 1000, 2000, 5000], 0.2 if quick else 1.0),
+        "slew": slew_time([10, 45, 90, 180]),
+        "tracking": tracking_error(300 if quick else 3600),
+        "handler": throughput(2000 if quick else 20000),
+    }
+
+
+def _flatten(result, prefix=""):
+    """
+    yield (name, value) of all numbers of the results
+    """
+    if isinstance(result, dict):
+        items = result.items()
+    elif isinstance(result, list):
+        items = (
+            (
+                (str(item.get("requested", item.get("distance", i))), item)
+                if isinstance(item, dict)
+                else (str(i), item)
+            )
+            for i, item in enumerate(result)
+        )
+    else:
+        yield prefix, result
+        return
+    for key, value in items:
+        yield from _flatten(value, f"{prefix}.{key}" if prefix else key)
+
+
+def compare(old, new):
+    """
+    print the numbers of two results side by side
+    """
+    before = dict(_flatten(old))
+    print(f"{'':40}{old['version']:>14}{new['version']:>14}{'change':>9}")
+    for name, value in _flatten(new):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            continue
+        previous = before.get(name)
+        if isinstance(previous, (int, float)):
+            change = f"{(value - previous) / previous:+8.1%}" if previous else ""
+            print(f"{name:40}{previous:14.3f}{value:14.3f} {change}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-o", "--output", help="write the results to this file")
+    parser.add_argument("--compare", help="compare with the results of this file")
+    parser.add_argument(
+        "--quick", action="store_true", help="shorter runs (less accurate)"
+    )
+    args = parser.parse_args()
+    results = run(args.quick)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
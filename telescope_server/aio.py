@@ -0,0 +1,142 @@
+# -*- encoding: utf-8 -*-
+# Copyright: Armin Leuprecht <mir@mur.at> and Stephan Burger <stephan101@gmx.de>
+# License: GNU GPL version 3; http://www.gnu.org/licenses/gpl.txt
+
+"""
+asyncio based telescope server
+
+all connections are served by one event loop instead of a thread per
+connection; the current position and the state changes are broadcast to all
+clients by timer tasks and the (blocking) controller calls are run in an
+executor
+"""
+
+# Standard Library
+import asyncio
+import logging
+
+from concurrent.futures import ThreadPoolExecutor
+
+# Local imports
+from .broadcast import PositionBroadcaster, StateNotifier
+from .codec import PositionEncoder
+from .framing import MAX_SIZE
+from .handler import TelescopeProtocol
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncTelescopeServer(TelescopeProtocol):
+    """
+    telescope server with the same wire protocol as handler.TelescopeServer
+    """
+
+    # a client with more unsent bytes misses the position broadcasts
+    write_limit = 4096
+
+    def __init__(self, server_address, controller, push_rate=2.0, workers=4):
+        self.server_address = server_address
+        self.controller = controller
+        self.broadcaster = PositionBroadcaster(
+            controller, self._position_message, push_rate
+        )
+        self.notifier = StateNotifier(controller)
+        self._encoder = PositionEncoder()
+        self._executor = ThreadPoolExecutor(workers)
+
+    def _position_message(self, ra, dec):
+        """
+        return the message with the given position for the stellarium clients
+
+        the transports may keep the data until it is sent, so it is copied
+        out of the reused buffer of the encoder (once for all clients)
+        """
+        return bytes(self._encoder.encode(ra, dec))
+
+    async def _call(self, function, *args):
+        """
+        run a blocking function in the executor
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, function, *args)
+
+    def _deliver(self, writer):
+        """
+        return a function that sends data to the client if that is
+        possible without blocking
+        """
+
+        def deliver(data):
+            if writer.transport.get_write_buffer_size() > self.write_limit:
+                return False
+            writer.write(data)
+            return True
+
+        return deliver
+
+    async def _serve(self, reader, writer):
+        """
+        execute the commands of one connection in the order they arrive
+        """
+        connection = self._connect(self._deliver(writer), writer.close)
+        self._keepalive(writer.get_extra_info("socket"))
+        try:
+            while True:
+                try:
+                    data = await asyncio.wait_for(
+                        reader.read(MAX_SIZE),
+                        (
+                            None
+                            if connection.subscriber or connection.control
+                            else self.idle
+                        ),
+                    )
+                except asyncio.TimeoutError:
+                    self._idle(connection)
+                    continue
+                if not data:
+                    break
+                for mtype, args in self._receive(connection, data):
+                    response = await self._call(self._run, mtype, args)
+                    if response is not None:
+                        writer.write(response)
+                        await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self._disconnect(connection)
+            writer.close()
+
+    async def _push(self, broadcaster):
+        """
+        publish the snapshots of the broadcaster at its rate
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time()
+        while True:
+            deadline = max(deadline + 1.0 / broadcaster.rate, loop.time())
+            await asyncio.sleep(deadline - loop.time())
+            if not len(broadcaster):
+                continue
+            try:
+                data = await self._call(broadcaster.snapshot)
+            except Exception:
+                logger.error("cannot get %s", broadcaster.subject)
+                continue
+            broadcaster.publish(data)
+
+    async def _main(self):
+        server = await asyncio.start_server(self._serve, *self.server_address)
+        push = [
+            asyncio.ensure_future(self._push(broadcaster))
+            for broadcaster in [self.broadcaster, self.notifier]
+        ]
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for task in push:
+                task.cancel()
+
+    def serve_forever(self):
+        asyncio.run(self._main())
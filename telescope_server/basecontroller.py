@@ -2,12 +2,22 @@
 # Copyright: Armin Leuprecht <mir@mur.at> and Stephan Burger <stephan101@gmx.de>
 # License: GNU GPL version 3; http://www.gnu.org/licenses/gpl.txt
 
+# Standard Library
+from threading import Lock
+
+# First party
+from telescope_server.protocol import topic
+
 
 class BaseController(object):
     """
     base controller class that implements all necessary functions
     """
 
+    # number of connected control clients (counted by the server)
+    _clients = 0
+    _clients_lock = Lock()
+
     def __init__(self):
         self._ra = 0
         self._dec = 0
@@ -47,3 +57,33 @@ class BaseController(object):
 
     def get_status(self, status_code):
         return "everything's fine"
+
+    def get_status_bulk(self, status_codes):
+        """
+        return the status responses of all given status codes
+        """
+        return [self.get_status(status_code) for status_code in status_codes]
+
+    def get_state(self):
+        """
+        return the values (strings) of the state topics by protocol.topic
+        """
+        return {topic.POSITION: "%s / %s" % self.current_pos()}
+
+    @property
+    def client_connected(self):
+        return self._clients > 0
+
+    def client_connect(self):
+        """
+        a control client connected
+        """
+        with self._clients_lock:
+            self._clients += 1
+
+    def client_disconnect(self):
+        """
+        a control client disconnected
+        """
+        with self._clients_lock:
+            self._clients -= 1
@@ -0,0 +1,205 @@
+# -*- encoding: utf-8 -*-
+# Copyright: Armin Leuprecht <mir@mur.at> and Stephan Burger <stephan101@gmx.de>
+# License: GNU GPL version 3; http://www.gnu.org/licenses/gpl.txt
+
+"""
+single shared broadcasters of the current position and state changes
+
+the position is computed and packed once per period and the same bytes are
+sent to every subscribed connection, so the cost does not grow with the
+number of clients; the state of the controller is computed once per period
+as well and every subscriber receives the topics that changed since the
+last message it received
+"""
+
+# Standard Library
+import logging
+import time
+
+from threading import Lock, Thread
+
+# First party
+from telescope_server.protocol import command, topic
+
+# Local imports
+from .framing import frame
+
+logger = logging.getLogger(__name__)
+
+
+class Subscriber(object):
+    """
+    a connection that receives the broadcast
+
+    deliver(data) tries to send the data without blocking and returns False
+    if the connection is not ready; a subscriber that missed more than
+    max_missed broadcasts in a row is dropped by calling drop()
+    """
+
+    def __init__(self, deliver, drop, max_missed=20):
+        self.deliver = deliver
+        self.drop = drop
+        self.max_missed = max_missed
+        self.missed = 0
+
+
+class PositionBroadcaster(object):
+    """
+    push the current position of the controller rate times per second
+    """
+
+    subject = "current position"
+
+    def __init__(self, controller, pack, rate=2.0):
+        self.controller = controller
+        self.rate = rate
+        self._pack = pack
+        self._subscribers = []
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def subscribe(self, deliver, drop, max_missed=20):
+        """
+        register a connection and return its subscriber
+        """
+        subscriber = Subscriber(deliver, drop, max_missed)
+        with self._lock:
+            self._subscribers = self._subscribers + [subscriber]
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers = [s for s in self._subscribers if s is not subscriber]
+
+    def snapshot(self):
+        """
+        compute and pack the current position
+        """
+        ra, dec = self.controller.current_pos()
+        return self._pack(ra, dec)
+
+    def _deliver(self, subscriber, data):
+        """
+        send the data to the subscriber and return if that succeeded
+
+        a subscriber that is not ready misses the data; one that is never
+        ready is dropped
+        """
+        try:
+            delivered = subscriber.deliver(data)
+        except Exception:
+            delivered = False
+            subscriber.missed = subscriber.max_missed
+        if delivered:
+            subscriber.missed = 0
+            return True
+        subscriber.missed += 1
+        if subscriber.missed >= subscriber.max_missed:
+            logger.info("drop slow client")
+            self.unsubscribe(subscriber)
+            try:
+                subscriber.drop()
+            except Exception:
+                pass
+        return False
+
+    def publish(self, data):
+        """
+        send the data to all subscribers
+
+        a subscriber that is not ready misses this broadcast (the next one
+        carries a newer position anyway)
+        """
+        for subscriber in self._subscribers:
+            self._deliver(subscriber, data)
+
+    def tick(self):
+        """
+        broadcast the current position if anybody listens
+        """
+        if self._subscribers:
+            try:
+                data = self.snapshot()
+            except Exception:
+                logger.error("cannot get %s", self.subject)
+                return
+            self.publish(data)
+
+    def run(self):
+        """
+        broadcast forever at the given rate
+        """
+        deadline = time.monotonic()
+        while True:
+            self.tick()
+            deadline = max(deadline + 1.0 / self.rate, time.monotonic())
+            time.sleep(max(deadline - time.monotonic(), 0))
+
+    def start(self):
+        """
+        run the broadcaster in a daemon thread
+        """
+        thread = Thread(target=self.run, daemon=True)
+        thread.start()
+        return thread
+
+
+# names of the state topics in the messages
+TOPIC_NAMES = {
+    topic.TRACKING: "tracking",
+    topic.MOTORRUN: "motorrun",
+    topic.CALIBRATION: "calibration",
+    topic.POSITION: "position",
+}
+
+
+class StateNotifier(PositionBroadcaster):
+    """
+    push the changes of the state topics of the controller
+
+    a message is a line starting with "!" followed by the changed topics
+    as name=value separated by semicolons
+    """
+
+    subject = "controller state"
+
+    def __init__(self, controller, rate=4.0):
+        super().__init__(controller, None, rate)
+
+    def subscribe(self, deliver, drop, topics, max_missed=20):
+        """
+        register a connection for the topics (bit mask of protocol.topic)
+        and return its subscriber
+
+        the current values of the topics are sent with the next message
+        """
+        subscriber = super().subscribe(deliver, drop, max_missed)
+        subscriber.topics = topics
+        subscriber.sent = {}
+        return subscriber
+
+    def snapshot(self):
+        """
+        return the current state of the controller
+        """
+        return self.controller.get_state()
+
+    def publish(self, state):
+        """
+        send the changed topics to each subscriber
+        """
+        for subscriber in self._subscribers:
+            changed = {
+                key: value
+                for key, value in state.items()
+                if key & subscriber.topics and subscriber.sent.get(key) != value
+            }
+            if not changed:
+                continue
+            data = "!%s" % ";".join(
+                "%s=%s" % (TOPIC_NAMES[key], value) for key, value in changed.items()
+            )
+            if self._deliver(subscriber, frame(command.SUBSCRIBE, data.encode())):
+                subscriber.sent.update(changed)
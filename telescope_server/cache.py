@@ -0,0 +1,59 @@
+# -*- encoding: utf-8 -*-
+# Copyright: Armin Leuprecht <mir@mur.at> and Stephan Burger <stephan101@gmx.de>
+# License: GNU GPL version 3; http://www.gnu.org/licenses/gpl.txt
+
+"""
+time bucketed cache for the status responses of the controller
+
+time is divided into buckets of the time-to-live of each status code; all
+requests within a bucket share one computation, even if they arrive at the
+same time from several clients
+"""
+
+# Standard Library
+import time
+
+from threading import Lock
+
+
+class StatusCache(object):
+    """
+    cache of status responses by status code
+
+    ttls maps status codes to their time-to-live in seconds, codes without
+    a time-to-live are never cached
+    """
+
+    def __init__(self, ttls, clock=time.monotonic):
+        self._ttls = ttls
+        self._clock = clock
+        self._entries = {}
+        self._locks = {code: Lock() for code in ttls}
+        self._generations = dict.fromkeys(ttls, 0)
+
+    def get(self, code, compute):
+        """
+        return the cached response for the status code or compute it
+        """
+        ttl = self._ttls.get(code)
+        if not ttl:
+            return compute()
+        bucket = int(self._clock() / ttl)
+        with self._locks[code]:
+            generation = self._generations[code]
+            entry = self._entries.get(code)
+            if entry is not None and entry[:2] == (bucket, generation):
+                return entry[2]
+            value = compute()
+            self._entries[code] = (bucket, generation, value)
+            return value
+
+    def invalidate(self, *codes):
+        """
+        forget the responses of the given status codes (all if none given)
+        """
+        for code in codes or list(self._generations):
+            if code in self._generations:
+                # a response computed meanwhile is outdated as well
+                self._generations[code] += 1
+                self._entries.pop(code, None)
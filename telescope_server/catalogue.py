@@ -0,0 +1,266 @@
+# -*- encoding: utf-8 -*-
+# Copyright: Armin Leuprecht <mir@mur.at> and Stephan Burger <stephan101@gmx.de>
+# License: GNU GPL version 3; http://www.gnu.org/licenses/gpl.txt
+
+"""
+catalogue of the fixed stars in compact arrays
+
+the names, J2000 coordinates, proper motions and magnitudes of the stars are
+kept in one structured numpy array; it is built once from the ephem star
+database or a user catalogue (csv file), saved as .npy cache file and
+memory-mapped at startup; the ephem bodies and the name index are only
+built when they are used
+
+a csv catalogue has a header line with the columns name, ra (hours) and dec
+(degrees), optionally mag, pmra and pmdec (mas/year); ra/dec may be given
+in sexagesimal notation (e.g. 5:34:31.9,22:00:52); objects without mag
+have the magnitude nan, they never count as bright and sort last
+
+usage: python -m telescope_server.catalogue [CSV ...] (build the cache files)
+"""
+
+# Standard Library
+import csv
+import io
+import logging
+import os
+import sys
+import zlib
+
+# Third party
+import ephem
+import ephem.stars
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# directory of the cache files
+CACHE_DIR = os.environ.get(
+    "CATALOGUE_CACHE",
+    os.path.join(os.path.expanduser("~"), ".cache", "telescope-server"),
+)
+
+
+class Catalogue(object):
+    """
+    fixed stars given by a structured array of the fields of dtype
+
+    ra/dec are J2000 (radians), the proper motions are given in mas/year
+    (the one of ra multiplied by cos(dec))
+
+    the version is part of the name of the cache files, it is raised when
+    the catalogues are built differently
+    """
+
+    version = 2
+
+    dtype = np.dtype(
+        [
+            ("name", "U32"),
+            ("ra", "f8"),
+            ("dec", "f8"),
+            ("pmra", "f4"),
+            ("pmdec", "f4"),
+            ("mag", "f4"),
+        ]
+    )
+
+    def __init__(self, entries):
+        self.entries = entries
+        self._ids = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def ra(self):
+        return self.entries["ra"]
+
+    @property
+    def dec(self):
+        return self.entries["dec"]
+
+    @property
+    def pmra(self):
+        return self.entries["pmra"]
+
+    @property
+    def pmdec(self):
+        return self.entries["pmdec"]
+
+    @property
+    def mag(self):
+        return self.entries["mag"]
+
+    def name(self, index):
+        return str(self.entries["name"][index])
+
+    def id(self, name):
+        """
+        return the index of the star with the given name
+        """
+        if self._ids is None:
+            # the first entry of a name wins
+            names = self.entries["name"]
+            self._ids = {str(names[i]): i for i in reversed(range(len(names)))}
+        return self._ids[name]
+
+    def body(self, index):
+        """
+        return a new ephem body of the star at the given index
+        """
+        name, ra, dec, pmra, pmdec, mag = self.entries[index].tolist()
+        return ephem.readdb(
+            "%s,f|S,%r|%r,%r|%r,%r"
+            % (name, ra * 12 / np.pi, pmra, dec * 180 / np.pi, pmdec, mag)
+        )
+
+    @classmethod
+    def from_db(cls, db):
+        """
+        build the catalogue from the lines of the ephem database format
+        (sorted by name)
+        """
+        rows = []
+        lines = [line for line in db.splitlines() if line.strip()]
+        for line in sorted(lines, key=lambda line: line.split(",")[0]):
+            body = ephem.readdb(line)
+            mag = float(line.split(",")[4] or 0)
+            rows.append((body.name, body._ra, body._dec, body._pmra, body._pmdec, mag))
+        return cls(np.array(rows, dtype=cls.dtype))
+
+    @classmethod
+    def from_csv(cls, text):
+        """
+        build the catalogue from the text of a csv file (in its order)
+        """
+        rows = []
+        for row in csv.DictReader(io.StringIO(text)):
+            row = {key.strip().lower(): value.strip() for key, value in row.items()}
+            rows.append(
+                (
+                    row["name"],
+                    ephem.hours(row["ra"]),
+                    ephem.degrees(row["dec"]),
+                    float(row.get("pmra") or 0),
+                    float(row.get("pmdec") or 0),
+                    float(row.get("mag") or "nan"),
+                )
+            )
+        return cls(np.array(rows, dtype=cls.dtype))
+
+    @classmethod
+    def join(cls, catalogues):
+        """
+        return one catalogue of the entries of all given catalogues
+        """
+        if len(catalogues) == 1:
+            return catalogues[0]
+        return cls(np.concatenate([c.entries for c in catalogues]))
+
+    def save(self, path):
+        """
+        save the catalogue atomically as .npy file
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = "%s.%d.tmp" % (path, os.getpid())
+        with open(temporary, "wb") as f:
+            np.save(f, self.entries)
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        memory-map the catalogue of the given .npy file
+        """
+        entries = np.load(path, mmap_mode="r")
+        if entries.dtype != cls.dtype:
+            raise ValueError("%s has an outdated format" % path)
+        return cls(entries)
+
+    @classmethod
+    def cached(cls, text, build, prefix="stars", cache_dir=CACHE_DIR):
+        """
+        return the catalogue that build() makes of the text from its cache
+        file
+
+        the cache file is named by the version and the checksum of the text,
+        so it is rebuilt if either changes; if it cannot be written the
+        catalogue is used from memory
+        """
+        path = os.path.join(
+            cache_dir,
+            "%s-%d-%08x.npy" % (prefix, cls.version, zlib.crc32(text.encode("utf-8"))),
+        )
+        try:
+            return cls.load(path)
+        except (OSError, ValueError):
+            pass
+        catalogue = build(text)
+        try:
+            catalogue.save(path)
+        except OSError as exc:
+            logger.info("cannot save the star catalogue: %s", exc)
+        return catalogue
+
+
+def stars():
+    """
+    return the catalogue of the ephem star database
+    """
+    return Catalogue.cached(ephem.stars.db, Catalogue.from_db)
+
+
+def load(paths):
+    """
+    return the catalogue of the ephem stars followed by the entries of the
+    csv files of the given paths
+    """
+    catalogues = [stars()]
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+        name = os.path.splitext(os.path.basename(path))[0]
+        catalogues.append(Catalogue.cached(text, Catalogue.from_csv, name))
+    return Catalogue.join(catalogues)
+
+
+class SkyObjects(object):
+    """
+    the given (solar system) bodies followed by the stars of the catalogue
+
+    the ephem bodies of the stars are created when they are first used
+    """
+
+    def __init__(self, bodies, catalogue):
+        self.bodies = bodies
+        self.catalogue = catalogue
+        self._stars = {}
+
+    def __len__(self):
+        return len(self.bodies) + len(self.catalogue)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if index < len(self.bodies):
+            return self.bodies[index]
+        index -= len(self.bodies)
+        if not 0 <= index < len(self.catalogue):
+            raise IndexError("sky object index out of range")
+        star = self._stars.get(index)
+        if star is None:
+            star = self._stars[index] = self.catalogue.body(index)
+        return star
+
+    def name(self, index):
+        """
+        return the name of the object without creating its body
+        """
+        if index < len(self.bodies):
+            return self.bodies[index].name
+        return self.catalogue.name(index - len(self.bodies))
+
+
+if __name__ == "__main__":
+    print("%d objects cached in %s" % (len(load(sys.argv[1:])), CACHE_DIR))
@@ -0,0 +1,125 @@
+# -*- encoding: utf-8 -*-
+# Copyright: Armin Leuprecht <mir@mur.at> and Stephan Burger <stephan101@gmx.de>
+# License: GNU GPL version 3; http://www.gnu.org/licenses/gpl.txt
+
+"""
+encoding and decoding of the messages with precompiled struct layouts
+
+a message starts with its size and type (two little endian 16 bit integers)
+followed by the data of the command; the current position is sent to the
+stellarium clients as size, type, time (microseconds), ra, dec and status
+"""
+
+# Standard Library
+import struct
+
+from time import time
+
+# First party
+from telescope_server.protocol import command
+
+# Local imports
+from .framing import MAX_SIZE, MIN_SIZE
+
+HEADER = struct.Struct("<hh")
+
+# data of the commands following the header
+PAYLOADS = {
+    # time, ra, dec
+    command.STELLARIUM: struct.Struct("<qIi"),
+    # lon, lat, alt
+    command.LOCATION: struct.Struct("<3f"),
+    # azimuthal steps, altitudal steps
+    command.MAKE_STEP: struct.Struct("<2h"),
+    # motor id, action, direction
+    command.START_MOT: struct.Struct("<3h"),
+    # object id
+    command.SET_ANGLE: struct.Struct("<h"),
+    # topics (bit mask)
+    command.SUBSCRIBE: struct.Struct("<h"),
+    # status code
+    command.STATUS: struct.Struct("<h"),
+}
+
+# number of status codes followed by the codes (of a bulk status request)
+STATUS_COUNT = struct.Struct("<h")
+MAX_STATUS_CODES = (MAX_SIZE - HEADER.size - STATUS_COUNT.size) // 2
+STATUS_CODES = [struct.Struct("<%dh" % count) for count in range(MAX_STATUS_CODES + 1)]
+
+# size, type, (time), ra, dec, status; the time has always been sent
+# big endian, it is packed separately to keep the messages unchanged
+POSITION = struct.Struct("<HH8xIii")
+POSITION_TIME = struct.Struct(">q")
+
+
+def stellarium2coords(ra_uint, dec_int):
+    return (ra_uint * 12.0 / 2147483648, dec_int * 90.0 / 1073741824)
+
+
+def coords2stellarium(ra, dec):
+    return (int(ra * (2147483648 / 12.0)), int(dec * (1073741824 / 90.0)))
+
+
+def decode(data):
+    """
+    return type and data (tuple) of the given message
+
+    the data of unknown commands or commands without data is empty
+    """
+    size, mtype = HEADER.unpack_from(data)
+    if mtype == command.STATUS_BULK:
+        (count,) = STATUS_COUNT.unpack_from(data, HEADER.size)
+        if not 0 <= count <= MAX_STATUS_CODES:
+            raise ValueError("invalid number of status codes: %d" % count)
+        return mtype, STATUS_CODES[count].unpack_from(
+            data, HEADER.size + STATUS_COUNT.size
+        )
+    payload = PAYLOADS.get(mtype)
+    if payload is None:
+        return mtype, ()
+    return mtype, payload.unpack_from(data, HEADER.size)
+
+
+def encode(mtype, *args):
+    """
+    return the message of the given command (padded to the minimal size)
+    """
+    if mtype == command.STATUS_BULK:
+        codes = STATUS_CODES[len(args)]
+        size = max(HEADER.size + STATUS_COUNT.size + codes.size, MIN_SIZE)
+        buffer = bytearray(size)
+        HEADER.pack_into(buffer, 0, size, mtype)
+        STATUS_COUNT.pack_into(buffer, HEADER.size, len(args))
+        codes.pack_into(buffer, HEADER.size + STATUS_COUNT.size, *args)
+        return bytes(buffer)
+    payload = PAYLOADS.get(mtype)
+    size = max(HEADER.size + (payload.size if payload else 0), MIN_SIZE)
+    buffer = bytearray(size)
+    HEADER.pack_into(buffer, 0, size, mtype)
+    if payload:
+        payload.pack_into(buffer, HEADER.size, *args)
+    return bytes(buffer)
+
+
+class PositionEncoder(object):
+    """
+    pack the current position messages into one reused buffer
+
+    the returned memoryview is only valid until the next call of encode
+    """
+
+    def __init__(self):
+        self._buffer = bytearray(POSITION.size)
+        self._view = memoryview(self._buffer)
+
+    def encode(self, ra, dec, timestamp=None):
+        """
+        pack given ra (h), dec (degree) together with the time (current
+        time if not given) for sending to stellarium
+        """
+        if timestamp is None:
+            timestamp = time()
+        ra_s, dec_s = coords2stellarium(ra, dec)
+        POSITION.pack_into(self._buffer, 0, POSITION.size, 0, ra_s, dec_s, 0)
+        POSITION_TIME.pack_into(self._buffer, HEADER.size, int(1e6 * timestamp))
+        return self._view
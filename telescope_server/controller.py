@@ -5,23 +5,30 @@
 # Standard Library
 import logging
 
-from datetime import datetime
+from concurrent.futures import CancelledError, wait
+from datetime import datetime, timedelta
 from itertools import combinations
+from math import pi
 from statistics import median
-from sys import maxsize
-from threading import Thread, Timer
-from time import sleep
+from threading import Event, Thread
 
 # Third party
 import ephem
-import ephem.stars
+import numpy as np
 
 # First party
-from telescope_server.protocol import status
+from telescope_server.protocol import status, topic
 
 # Local imports
+from . import catalogue, metrics
 from .basecontroller import BaseController
+from .cache import StatusCache
+from .ephemeris import EphemerisCache, horizon_radec, horizon_transform
+from .executor import MotionExecutor
 from .motor import Motor
+from .planner import Move
+from .pulse import Timeline
+from .sky import StarField, precess
 
 
 class Controller(BaseController):
@@ -36,32 +43,110 @@ class Controller(BaseController):
     az_pins = [15, 14, 8]
     alt_pins = [23, 18, 7]
 
-    def __init__(self):
+    # pulse backend of the motors (the default backend if None)
+    backend = None
+
+    # stars up to this magnitude are bright
+    bright_magnitude = 2.0
+
+    # radius (degrees) of the field around the pointing
+    field_radius = 1.0
+
+    # duration of a tracking tick in seconds
+    tracking_tick = 0.5
+
+    # time-to-live of the cached status responses in seconds
+    status_ttl = {
+        status.LOCATION: 60,
+        status.RADEC: 1,
+        status.AZALT: 0.5,
+        status.CALIBRATED: 60,
+        status.SPR: 60,
+        status.AZ_ANGLES: 60,
+        status.ALT_ANGLES: 60,
+        status.SIGHTED_OBJ: 60,
+        status.CURR_STEPS: 0.5,
+        status.STEP_LATE: 1,
+        status.VISIBLE_OBJ: 30,
+        status.NEAREST_OBJ: 1,
+        status.FIELD_OBJ: 1,
+    }
+
+    # duration of the tracking ticks and the ephem computations
+    tracking_time = metrics.registry.histogram("tracking_tick_us")
+    ephem_time = metrics.registry.histogram("ephem_us")
+
+    # status responses that are outdated when motors move, the target or
+    # observer is changed or the calibration changes
+    _motion_status = (
+        status.AZALT,
+        status.CURR_STEPS,
+        status.STEP_LATE,
+        status.NEAREST_OBJ,
+        status.FIELD_OBJ,
+    )
+    _target_status = (status.RADEC,)
+    _observer_status = (
+        status.LOCATION,
+        status.RADEC,
+        status.VISIBLE_OBJ,
+        status.NEAREST_OBJ,
+        status.FIELD_OBJ,
+    )
+    _calibration_status = (
+        status.CALIBRATED,
+        status.SPR,
+        status.AZ_ANGLES,
+        status.ALT_ANGLES,
+        status.SIGHTED_OBJ,
+        status.AZALT,
+        status.CURR_STEPS,
+    )
+
+    def __init__(self, catalogues=()):
+        """
+        catalogues are the csv files of user catalogues (appended to the
+        sky objects)
+        """
 
         self.logger = logging.getLogger(__name__)
 
         # initialize the motors
         self.motors = [
-            Motor("Azimuth", self.az_pins, positive=1),
-            Motor("Altitude", self.alt_pins, positive=-1),
+            Motor("Azimuth", self.az_pins, positive=1, backend=self.backend),
+            Motor("Altitude", self.alt_pins, positive=-1, backend=self.backend),
         ]
 
         # initialize observer and target
         self._observer = ephem.Observer()
         self._target = ephem.FixedBody()
 
-        # insteresting objects in our solar system and main stars
-        self._sky_objects = [
-            ephem.Sun(),
-            ephem.Moon(),
-            ephem.Mercury(),
-            ephem.Venus(),
-            ephem.Mars(),
-            ephem.Jupiter(),
-            ephem.Saturn(),
-        ]
-        for star in sorted([x.split(",")[0] for x in ephem.stars.db.split("\n") if x]):
-            self._sky_objects.append(ephem.star(star))
+        # interpolated az/alt of the target and transformation of the motor
+        # angles to ra/dec; each cache computes with an observer of its own
+        # (they run in different threads)
+        self._target_observer = ephem.Observer()
+        self._target_cache = EphemerisCache(self._target_azalt)
+        self._radec_observer = ephem.Observer()
+        self._radec_observer.pressure = 0
+        self._radec_cache = EphemerisCache(self._radec_transform)
+
+        # insteresting objects in our solar system, main stars and the
+        # objects of the user catalogues
+        # (the bodies of the stars are created when they are used)
+        self._solar_system = 7
+        self._sky_objects = catalogue.SkyObjects(
+            [
+                ephem.Sun(),
+                ephem.Moon(),
+                ephem.Mercury(),
+                ephem.Venus(),
+                ephem.Mars(),
+                ephem.Jupiter(),
+                ephem.Saturn(),
+            ],
+            catalogue.load(catalogues),
+        )
+        self._star_field = StarField(self._sky_objects.catalogue)
 
         # set boolean variable indicating tracking
         self._is_tracking = False
@@ -71,8 +156,9 @@ class Controller(BaseController):
         # initialize angles/steps lists for calibration
         self._angles_steps = [[], []]
 
-        # initialize motor threads
-        self._motor_threads = [None, None]
+        # the motions are executed by one worker per motor
+        self._executor = MotionExecutor(self.motors)
+        self._tracking_stop = Event()
 
         az_default_spr = 1293009
         alt_default_spr = 1560660
@@ -80,8 +166,7 @@ class Controller(BaseController):
         self.motors[0].steps_per_rev = az_default_spr
         self.motors[1].steps_per_rev = alt_default_spr
 
-        # at startup no client is connected
-        self._client_connected = False
+        self._status_cache = StatusCache(self.status_ttl)
 
     @property
     def location(self):
@@ -116,21 +201,19 @@ class Controller(BaseController):
 
     @property
     def is_motor_on(self):
-        try:
-            for t in self._motor_threads:
-                self.logger.debug("on motor thread %s", t)
-                if (t is not None) and t.isAlive():
-                    self.logger.debug("isaliver %s", t)
-                    return True
-            self.logger.debug("isnotaliver %s", t)
-            return False
-        except Exception:
-            self.logger.debug("isnotaliverexeption")
-            return False
+        return self._executor.busy()
 
-    @property
-    def client_connected(self):
-        return self._client_connected
+    def _utcnow(self):
+        """
+        return the current time of the controller
+        """
+        return datetime.utcnow()
+
+    def _wait(self, event, timeout):
+        """
+        wait until the event is set or the timeout (seconds) passed
+        """
+        return event.wait(timeout)
 
     def _set_step_delay(self, motor_index, delay):
         """
@@ -138,45 +221,42 @@ class Controller(BaseController):
         """
         self.motors[motor_index].delay = delay
 
+    def _motion(self, future):
+        """
+        the motion of the future changes the motion status responses
+        """
+        self._status_cache.invalidate(*self._motion_status)
+        future.add_done_callback(
+            lambda future: self._status_cache.invalidate(*self._motion_status)
+        )
+        return future
+
     def _start_motor(self, motor_index, direction):
         """
         start a motor with a given direction and infinite steps
         """
         self.logger.debug("start %s motor", self.motors[motor_index].name)
-        try:
-            self._motor_threads[motor_index].join()
-        except Exception:
-            pass
-
-        self._motor_threads[motor_index] = Thread(
-            target=self.motors[motor_index].step, args=[maxsize, direction]
-        )
-        self._motor_threads[motor_index].start()
+        return self._motion(self._executor.run(motor_index, direction))
 
     def _stop_motors(self, motors=[0, 1]):
         """
         stop the given motors if they are running
+
+        return the futures of the stopped motions
         """
         for m in motors:
             self.logger.debug("stop %s motor", self.motors[m].name)
-            self.motors[m].stop = True
+        return self._executor.stop(motors)
 
     def _move_to(self, az, alt):
         """
         move to the position given by azimuth and altitude in degrees
-        if there are other running moves wait till they are finished
+        after the moves that are already queued
+
+        both motors are driven together so that they arrive at once
         """
         self.logger.debug("move to %f / %f", az, alt)
-        try:
-            for t in self._motor_threads:
-                t.join()
-        except Exception:
-            pass
-        zipped = list(zip(self.motors, [az, alt]))
-        self._motor_threads = [Thread(target=x[0].move, args=[x[1]]) for x in zipped]
-
-        for t in self._motor_threads:
-            t.start()
+        return self._motion(self._executor.move_to([az, alt]))
 
     def _start_tracking(self):
         """
@@ -185,7 +265,10 @@ class Controller(BaseController):
         if not self._is_tracking:
             self.logger.debug("start tracking")
             self._is_tracking = True
-            self._tracking_thread = Thread(target=self._do_tracking)
+            self._tracking_stop = Event()
+            self._tracking_thread = Thread(
+                target=self._do_tracking, args=[self._tracking_stop]
+            )
             self._tracking_thread.start()
 
     def _stop_tracking(self):
@@ -194,60 +277,193 @@ class Controller(BaseController):
         """
         if self._is_tracking:
             self.logger.debug("stop tracking")
-            try:
-                self._stop_motors()
-                self._is_tracking = False
-                self._tracking_thread.join()
-                # be sure that motors are really stopped
-                self._stop_motors()
-            except Exception:
-                pass
+            self._is_tracking = False
+            # the running tracking move brakes down and later ones are void
+            self._tracking_stop.set()
+            self._tracking_thread.join()
+
+    def _target_azalt(self, date, key):
+        """
+        compute az/alt of the target (radians) at the given date, key is
+        the ra/dec of the target and the observer
+        """
+        with self.ephem_time.time():
+            observer = self._target_observer
+            observer.lon, observer.lat, observer.elev = key[2:]
+            observer.date = date
+            target = ephem.FixedBody()
+            target._ra, target._dec = key[:2]
+            target.compute(observer)
+            return target.az, target.alt
+
+    def _radec_transform(self, date, key):
+        """
+        compute the transformation of az/alt to ra/dec at the given date,
+        key is the observer
+        """
+        with self.ephem_time.time():
+            observer = self._radec_observer
+            observer.lon, observer.lat, observer.elev = key
+            observer.date = date
+            return horizon_transform(observer)
+
+    def _radec_of(self, date, angles):
+        """
+        return ra/dec (radians) of the given motor angles at the date
+        """
+        return horizon_radec(
+            self._radec_cache(date, self._observer_key()),
+            angles[0] * ephem.degree,
+            angles[1] * ephem.degree,
+            self._observer.pressure,
+            self._observer.temp,
+        )
+
+    def _observer_key(self):
+        return (self._observer.lon, self._observer.lat, self._observer.elev)
 
-    def _do_tracking(self):
+    def _target_angles(self):
         """
-        run a loop and recalculate
+        return the angles (degrees) of the target at the end of the
+        current tracking tick
         """
-        while self._is_tracking:
-            try:
-                self._observer.date = datetime.utcnow()
-                self._target.compute(self._observer)
-                self._move_to(
-                    self._target.az / ephem.degree, self._target.alt / ephem.degree
-                )
-                sleep(0.1)
-            except Exception:
-                self._is_tracking = False
+        az, alt = self._target_cache(
+            ephem.Date(self._utcnow() + timedelta(seconds=self.tracking_tick)),
+            (self._target._ra, self._target._dec) + self._observer_key(),
+        )
+        return [az / ephem.degree, alt / ephem.degree]
+
+    def _retarget(self):
+        """
+        redirect a running slew to the target from the current velocities
+        of the motors; return False if there is no slew
+        """
+        return self._executor.retarget(self._target_angles())
+
+    def _do_tracking(self, stop):
+        """
+        run the motors with continuously adjusted step rates until the stop
+        event is set
 
-    def _visible_objects(self):
+        every tick the step rate of each motor is chosen such that it reaches
+        the position of the target at the end of the tick, thus position
+        errors are folded into the rate; the ticks continue one time line and
+        each motor ramps from the rate of the last tick to the new one; only
+        if a motor is too far off to get to its rate within the tick the
+        telescope slews to the target first
         """
-        return list of visible objects
+        tick = int(self.tracking_tick * 1e9)
+        timeline = None
+        # direction and step delay of the motors at the end of the last tick
+        rates = [(True, 0)] * len(self.motors)
+        while not stop.is_set():
+            with self.tracking_time.time():
+                try:
+                    angles = self._target_angles()
+                    moves = []
+                    for motor, angle, (moving, delay) in zip(
+                        self.motors, angles, rates
+                    ):
+                        steps, direction = motor.target_steps(angle)
+                        delay = delay if moving == direction else 0
+                        schedule = motor.velocity_schedule(steps, tick, delay)
+                        steps = schedule is not None and len(schedule)
+                        moves.append(Move(motor, steps, direction, schedule))
+
+                    if any(move.schedule is None for move in moves):
+                        self._executor.move_to(angles, cancel=stop).result()
+                        timeline = None
+                    elif any(move.steps for move in moves):
+                        if timeline is None:
+                            timeline = Timeline(self.motors[0].deadline_timing)
+                            timeline.start(self.motors[0].backend.now())
+                        self._executor.drive(
+                            moves, cancel=stop, timeline=timeline
+                        ).result()
+                    else:
+                        self._wait(stop, self.tracking_tick)
+                        timeline = None
+                    rates = [
+                        (
+                            move.direction,
+                            move.schedule[-1] if 0 < move.done == move.steps else 0,
+                        )
+                        for move in moves
+                    ]
+                    self._status_cache.invalidate(*self._motion_status)
+                except CancelledError:
+                    pass
+                except Exception:
+                    self._is_tracking = False
+                    break
+
+    def _visible_objects(self, date=None):
+        """
+        return list of visible objects (now if no date is given)
+
+        the solar system bodies are computed by ephem, the fixed stars
+        are computed all at once by the star field
         """
         ret = []
-        self._observer.date = datetime.utcnow()
-        for i in range(len(self._sky_objects)):
-            obj = self._sky_objects[i]
-            obj.compute(self._observer)
-            if obj.alt > 0:
-                ret.append("%d-%s" % (i, obj.name))
+        self._observer.date = date or self._utcnow()
+        with self.ephem_time.time():
+            for i in range(self._solar_system):
+                obj = self._sky_objects[i]
+                obj.compute(self._observer)
+                if obj.alt > 0:
+                    ret.append("%d-%s" % (i, obj.name))
+            visible = self._star_field.visible(self._observer)
+        for i in visible + self._solar_system:
+            ret.append("%d-%s" % (i, self._sky_objects.name(i)))
         return ",".join(ret)
 
-    def _reset_client_connection(self):
+    def _pointing(self, date, angles):
+        """
+        return the ra/dec (radians) at the date of the given motor angles
+        """
+        ra, dec = self._radec_of(date, angles)
+        # radec_of is given at the epoch J2000, the stars at the date
+        return precess(ra, dec, date)
+
+    def _nearest_object(self, date, angles):
         """
-        reset the client connected flag
+        return the bright star nearest to the given motor angles
         """
-        self._client_connected = False
+        date = ephem.Date(date)
+        ra, dec = self._pointing(date, angles)
+        i = self._star_field.nearest(date, ra, dec, self.bright_magnitude)
+        if i is None:
+            return "no bright star"
+        i += self._solar_system
+        return "%d-%s" % (i, self._sky_objects.name(i))
+
+    def _field_objects(self, date, angles):
+        """
+        return the list of stars within the field radius around the given
+        motor angles (the brightest first)
+        """
+        date = ephem.Date(date)
+        ra, dec = self._pointing(date, angles)
+        found = self._star_field.cone(date, ra, dec, self.field_radius * ephem.degree)
+        found = found[np.argsort(self._sky_objects.catalogue.mag[found], kind="stable")]
+        return ",".join(
+            "%d-%s" % (i, self._sky_objects.name(i)) for i in found + self._solar_system
+        )
 
     def goto(self, ra, dec):
         """
         implenetation of the goto function
 
         get the ra and dec from stellarium, set the current time
-        stop/start tracking
+        stop/start tracking unless a running slew can be redirected
         """
         self.logger.debug("goto: %f / %f", ra, dec)
         self._target._ra = "%f" % ra
         self._target._dec = "%f" % dec
-        self._observer.date = datetime.utcnow()
+        self._status_cache.invalidate(*self._target_status)
+        self._observer.date = self._utcnow()
+        if self._is_tracking and self._retarget():
+            return
         # self._stop_motors()
         self._stop_tracking()
         self._start_tracking()
@@ -260,11 +476,10 @@ class Controller(BaseController):
         ephem works with radians so ra must be converted to hours
         and dec must be converted to degrees
         """
-        self._observer.date = datetime.utcnow()
-        ra, dec = self._observer.radec_of(
-            self.motors[0].angle * ephem.degree, self.motors[1].angle * ephem.degree
+        ra, dec = self._radec_of(
+            ephem.Date(self._utcnow()), [m.state.angle for m in self.motors]
         )
-        ra /= 15.0 * ephem.degree
+        ra = ra % (2 * pi) / (15.0 * ephem.degree)
         dec /= ephem.degree
         self.logger.debug("send: %f / %f", ra, dec)
 
@@ -279,6 +494,7 @@ class Controller(BaseController):
         self._observer.lon = lon * ephem.degree
         self._observer.lat = lat * ephem.degree
         self._observer.elev = alt
+        self._status_cache.invalidate(*self._observer_status)
         self.logger.debug(
             "set location %s / %s / %s",
             self._observer.lon,
@@ -303,6 +519,7 @@ class Controller(BaseController):
             motor.angle = 0
             motor.steps = 0
             motor.steps_per_rev = 1300000
+        self._status_cache.invalidate(*self._calibration_status)
 
     def stop_calibration(self):
         """
@@ -340,6 +557,7 @@ class Controller(BaseController):
                 self.motors[i].steps_per_rev = int(median(steps_list))
             except Exception:
                 pass
+        self._status_cache.invalidate(*self._calibration_status)
         self.logger.debug(
             "steps per revolution: %d / %d",
             self.motors[0].steps_per_rev,
@@ -358,13 +576,18 @@ class Controller(BaseController):
         restart = self._is_tracking
         self._stop_tracking()
         self.logger.debug("step motors: %d / %d", az_steps, alt_steps)
-        self.motors[0].step(abs(az_steps), az_steps > 0)
-        self.motors[1].step(abs(alt_steps), alt_steps > 0)
+        # both motors are driven by one pulse train
+        moves = [
+            Move(motor, abs(steps), steps > 0, motor.schedule(abs(steps)))
+            for motor, steps in zip(self.motors, [az_steps, alt_steps])
+        ]
+        wait([self._motion(self._executor.drive(moves))])
         if self.calibrated:
-            self._observer.date = datetime.utcnow()
+            self._observer.date = self._utcnow()
             self._target._ra, self._target._dec = self._observer.radec_of(
                 self.motors[0].angle * ephem.degree, self.motors[1].angle * ephem.degree
             )
+            self._status_cache.invalidate(*self._target_status)
             # restart tracking if it was active
             if restart:
                 self._start_tracking()
@@ -378,7 +601,7 @@ class Controller(BaseController):
         if tracking is on stop it and restart it afterwards
         """
         # if not self.calibrated:
-        self._stop_motors([motor_id])
+        stopped = self._stop_motors([motor_id])
         self.running[motor_id] = False
 
         if action:
@@ -393,11 +616,14 @@ class Controller(BaseController):
             if self.calibrated:
                 if not any(self.running):
                     # no motor is running anymore thus adjust target
-                    self._observer.date = datetime.utcnow()
+                    # (once it is braked down)
+                    wait(stopped)
+                    self._observer.date = self._utcnow()
                     self._target._ra, self._target._dec = self._observer.radec_of(
                         self.motors[0].angle * ephem.degree,
                         self.motors[1].angle * ephem.degree,
                     )
+                    self._status_cache.invalidate(*self._target_status)
                     # restart tracking if tracking was active
                     if any(self.restart):
                         self._start_tracking()
@@ -406,15 +632,16 @@ class Controller(BaseController):
         try:
             self.choose_object_id = object_id
             obj = self._sky_objects[self.choose_object_id]
-            self._observer.date = datetime.utcnow()
+            self._observer.date = self._utcnow()
             obj.compute(self._observer)
             self._target._ra, self._target._dec = obj.a_ra, obj.a_dec
+            self._status_cache.invalidate(*self._target_status)
             self.logger.debug(
                 "choose %s %s %s", obj.name, self._target._ra, self._target._dec
             )
             return True
         except Exception:
-            self.logger.debug(f"could not set coordinates of object nr. {object_id}")
+            self.logger.debug("could not set coordinates of object nr. %s", object_id)
 
     def apply_object(self):
         """
@@ -427,14 +654,14 @@ class Controller(BaseController):
         try:
             obj = self._sky_objects[self.choose_object_id]
             self.logger.debug("set %s", obj.name)
-            self._observer.date = datetime.utcnow()
+            self._observer.date = self._utcnow()
             obj.compute(self._observer)
             self.motors[0].angle = obj.az / ephem.degree
             self.motors[1].angle = obj.alt / ephem.degree
             for i in range(2):
-                self._angles_steps[i].append(
-                    (self.motors[i].angle, self.motors[i].steps)
-                )
+                state = self.motors[i].state
+                self._angles_steps[i].append((state.angle, state.steps))
+            self._status_cache.invalidate(*self._calibration_status)
         except Exception:
             self.logger.error("no object has been choosen")
 
@@ -456,26 +683,75 @@ class Controller(BaseController):
         """
         implentation of get status
 
+        responses are cached for the time-to-live of the status code
+        """
+        return self._status_cache.get(status_code, lambda: self._status(status_code))
+
+    def get_status_bulk(self, status_codes):
+        """
+        implementation of get status for a list of status codes
+
+        the motion status responses are computed from one snapshot of the
+        motors and the time; all other responses only change by commands
+        (which invalidate them) and are taken from the cache
+        """
+        snapshot = self._snapshot()
+        responses = []
+        for status_code in status_codes:
+            if status_code in self._motion_status:
+                responses.append(self._status(status_code, snapshot))
+            else:
+                responses.append(
+                    self._status_cache.get(
+                        status_code,
+                        lambda code=status_code: self._status(code, snapshot),
+                    )
+                )
+        return responses
+
+    def get_state(self):
+        """
+        implementation of get state
+        """
+        return {
+            topic.TRACKING: self._is_tracking and "YES" or "NO",
+            topic.MOTORRUN: self.is_motor_on and "YES" or "NO",
+            topic.CALIBRATION: self.calibrated and "YES" or "NO",
+            topic.POSITION: "%s / %s" % (self.azimuth, self.altitude),
+        }
+
+    def _snapshot(self):
+        """
+        return the current time and the steps, angle and worst lateness of
+        each motor
+        """
+        states = [m.state for m in self.motors]
+        return (
+            self._utcnow(),
+            [
+                (state.steps, state.angle, m.worst_late)
+                for m, state in zip(self.motors, states)
+            ],
+        )
+
+    def _status(self, status_code, snapshot=None):
+        """
+        compute the status response (of the given snapshot)
+
         see code what is returned
         """
+        date, motors = snapshot or self._snapshot()
         if status_code == status.LOCATION:
             return self.location
         elif status_code == status.RADEC:
             return self.target
         elif status_code == status.AZALT:
-            return "%s / %s" % (self.azimuth, self.altitude)
+            return "%s / %s" % tuple(
+                [ephem.degrees("%f" % angle) for _, angle, _ in motors]
+            )
         elif status_code == status.CALIBRATED:
             return "calibrated: %s" % (self.calibrated and "YES" or "NO")
         elif status_code == status.TRACKING:
-            # tracking is checked every second so set a timer to indicate that
-            # a client is connected
-            try:
-                self._conn_timer.cancel()
-            except Exception:
-                pass
-            self._client_connected = True
-            self._conn_timer = Timer(3, self._reset_client_connection)
-            self._conn_timer.start()
             return "tracking: %s" % (self._is_tracking and "YES" or "NO")
         elif status_code == status.SPR:
             return "steps per revolution (az/alt): %d / %d" % tuple(
@@ -488,12 +764,19 @@ class Controller(BaseController):
         elif status_code == status.SIGHTED_OBJ:
             return "%d" % len(self._angles_steps[0])
         elif status_code == status.CURR_STEPS:
-            return "current steps (az/alt): %d / %d" % (
-                self.motors[0].steps,
-                self.motors[1].steps,
+            return "current steps (az/alt): %d / %d" % tuple(
+                [steps for steps, _, _ in motors]
+            )
+        elif status_code == status.STEP_LATE:
+            return "worst step lateness of last move (az/alt): %d / %d us" % tuple(
+                [late * 1e6 for _, _, late in motors]
             )
         elif status_code == status.VISIBLE_OBJ:
-            return self._visible_objects()
+            return self._visible_objects(date)
+        elif status_code == status.NEAREST_OBJ:
+            return self._nearest_object(date, [angle for _, angle, _ in motors])
+        elif status_code == status.FIELD_OBJ:
+            return self._field_objects(date, [angle for _, angle, _ in motors])
         # elif status_code == status.MOTORRUN:
         #     return "tracking: %s" % (self._is_motorrun and "YES" or "NO")
         else:
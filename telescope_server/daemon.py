@@ -19,11 +19,14 @@ import logging
 import os
 import pkgutil
 import sys
+import time
+
+from threading import Thread
 
 # First party
 import telescope_server.plugins as pl
 
-from telescope_server import handler
+from telescope_server import aio, handler, metrics
 
 
 def _getargs(args=None):
@@ -33,7 +36,32 @@ def _getargs(args=None):
     parser.add_argument(
         "--controller",
         default=os.environ.get("CONTROLLER", "telescope_server.controller"),
-        help="module name that implements the Controller class",
+        help="module name that implements the Controller class "
+        "(telescope_server.simulated_controller needs no hardware)",
+    )
+    parser.add_argument(
+        "--server",
+        choices=["threading", "asyncio"],
+        default=os.environ.get("SERVER", "threading"),
+        help="serve connections by threads or by an asyncio event loop",
+    )
+    parser.add_argument(
+        "--push-rate",
+        type=float,
+        default=os.environ.get("PUSH_RATE", 2.0),
+        help="positions sent to the stellarium clients per second",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=os.environ.get("METRICS_PORT", 0),
+        help="serve the metrics as text over http on this port (0: off)",
+    )
+    parser.add_argument(
+        "--catalogues",
+        nargs="+",
+        default=os.environ.get("CATALOGUES", []),
+        help="csv files of user catalogues appended to the sky objects",
     )
     parser.add_argument(
         "--user-plugins",
@@ -54,6 +82,8 @@ def _getargs(args=None):
     ret = parser.parse_args(args)
     if not isinstance(ret.user_plugins, list):
         ret.user_plugins = ret.user_plugins.split()
+    if not isinstance(ret.catalogues, list):
+        ret.catalogues = ret.catalogues.split()
 
     return ret
 
@@ -67,14 +97,52 @@ def _load_plugin(modname, controller):
     try:
         module = importlib.import_module(modname)
         plugin = module.__getattribute__(name.capitalize())(controller)
-        logging.info(f"plugin loaded: {name} ({module.__doc__.strip()})")
+        logging.info("plugin loaded: %s (%s)", name, module.__doc__.strip())
     except Exception:
         plugin = None
-        logging.warning(f"plugin {name} could not be loaded")
+        logging.warning("plugin %s could not be loaded", name)
 
     return (name, plugin)
 
 
+def _load_plugins(controller, user_plugins, timer):
+    """
+    load the plugins and the extra user plugins with the controller
+    """
+    plugins = {}
+    for importer, modname, ispkg in pkgutil.walk_packages(
+        path=pl.__path__, prefix=pl.__name__ + "."
+    ):
+        name, plugin = _load_plugin(modname, controller)
+        if plugin:
+            plugins[name] = plugin
+
+    # load extra plugin
+    for user_plugin in user_plugins:
+        name, plugin = _load_plugin(user_plugin, controller)
+        if plugin:
+            plugins[name] = plugin
+    timer.phase("plugins")
+    return plugins
+
+
+class _StartupTimer(object):
+    """
+    log the duration of every startup phase and keep it as metric
+    """
+
+    def __init__(self):
+        self._start = time.perf_counter()
+
+    def phase(self, name):
+        now = time.perf_counter()
+        logging.info("startup: %s took %.3f s", name, now - self._start)
+        metrics.registry.gauge("startup_%s_ms" % name).set(
+            round((now - self._start) * 1000)
+        )
+        self._start = now
+
+
 def run(args=None):
 
     args = _getargs(args)
@@ -91,27 +159,35 @@ def run(args=None):
         datefmt="%Y-%m-%d %H:%M:%S",
     )
 
+    # the durations of the startup phases are logged and kept as metrics
+    timer = _StartupTimer()
     controller_module = importlib.import_module(args.controller)
-    controller = controller_module.Controller()
-
-    server = handler.TelescopeServer(
-        (args.host, args.port), controller, handler.TelescopeRequestHandler
-    )
-
-    # load plugins and generate instance with the controller
-    plugins = {}
-    for importer, modname, ispkg in pkgutil.walk_packages(
-        path=pl.__path__, prefix=pl.__name__ + "."
-    ):
-        name, plugin = _load_plugin(modname, controller)
-        if plugin:
-            plugins[name] = plugin
-
-    # load extra plugin
-    for user_plugin in args.user_plugins:
-        name, plugin = _load_plugin(user_plugin, controller)
-        if plugin:
-            plugins[name] = plugin
+    timer.phase("import")
+    # only controllers with sky objects take user catalogues
+    options = {"catalogues": args.catalogues} if args.catalogues else {}
+    controller = controller_module.Controller(**options)
+    timer.phase("controller")
+
+    if args.server == "asyncio":
+        server = aio.AsyncTelescopeServer(
+            (args.host, args.port), controller, args.push_rate
+        )
+    else:
+        server = handler.TelescopeServer(
+            (args.host, args.port),
+            controller,
+            handler.TelescopeRequestHandler,
+            args.push_rate,
+        )
+    timer.phase("server")
+
+    if args.metrics_port:
+        metrics.serve((args.host, args.metrics_port))
+
+    # the plugins are loaded while the server already serves the clients
+    Thread(
+        target=_load_plugins, args=[controller, args.user_plugins, timer], daemon=True
+    ).start()
 
     # terminate with Ctrl-C
     try:
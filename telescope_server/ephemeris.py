@@ -0,0 +1,167 @@
+# -*- encoding: utf-8 -*-
+# Copyright: Armin Leuprecht <mir@mur.at> and Stephan Burger <stephan101@gmx.de>
+# License: GNU GPL version 3; http://www.gnu.org/licenses/gpl.txt
+
+"""
+interpolating cache for ephemeris computations
+
+coordinates of a target (or the transformation of az/alt to ra/dec of an
+observer) change slowly and smoothly with time, so they are sampled at
+coarse time points and interpolated quadratically in between
+"""
+
+# Standard Library
+import logging
+
+from math import atan2, cos, hypot, pi, sin
+from threading import Lock
+
+# Third party
+import ephem
+import numpy as np
+
+# Local imports
+from .sky import unit_vectors
+
+logger = logging.getLogger(__name__)
+
+
+def _unwrap(value, reference):
+    """
+    return value shifted by multiples of 2 pi to be close to reference
+    """
+    return reference + (value - reference + pi) % (2 * pi) - pi
+
+
+# hour angle and declination of the directions where radec_of is sampled
+# (the celestial poles, where it loses precision, are avoided)
+_SAMPLES = np.radians(
+    [(0, 0), (90, 0), (180, 0), (270, 0), (0, 45), (180, -45), (90, -45), (270, 45)]
+)
+
+
+def horizon_transform(observer):
+    """
+    return the transformation of the horizon system to the astrometric
+    ra/dec of the observer at its date as a tuple of 12 numbers (a 3x3
+    matrix A and an offset b, the aberration)
+
+    the unit vector of ra/dec is the normalised A u + b of the unit vector
+    u of az/alt; it is fitted to radec_of at some directions, refraction
+    must be switched off (pressure 0) and is left to horizon_radec
+    """
+    ha, dec = _SAMPLES.T
+    lat = observer.lat
+    alt = np.arcsin(np.sin(lat) * np.sin(dec) + np.cos(lat) * np.cos(dec) * np.cos(ha))
+    az = np.arctan2(
+        -np.cos(dec) * np.sin(ha),
+        np.sin(dec) * np.cos(lat) - np.cos(dec) * np.cos(ha) * np.sin(lat),
+    )
+    u = np.column_stack([unit_vectors(az, alt), np.ones(len(az))])
+    v = unit_vectors(*np.array([observer.radec_of(*x) for x in zip(az, alt)]).T)
+    # the lengths of A u + b are found by iteration, they differ from 1 by
+    # the aberration only (each pass gains a factor of 3, 5 passes give
+    # some hundredths of an arcsecond)
+    length = np.ones(len(u))
+    for i in range(5):
+        transform = np.linalg.lstsq(u, v * length[:, None], rcond=None)[0]
+        length = np.linalg.norm(u.dot(transform), axis=1)
+    return tuple(transform.ravel())
+
+
+def horizon_radec(transform, az, alt, pressure=1010.0, temp=15.0):
+    """
+    return the astrometric ra/dec (radians) of the observed az/alt
+    (radians) by a transformation of horizon_transform
+    """
+    alt = ephem.unrefract(pressure, temp, alt)
+    u = (cos(alt) * cos(az), cos(alt) * sin(az), sin(alt), 1.0)
+    x, y, z = [sum(u[j] * transform[3 * j + i] for j in range(4)) for i in range(3)]
+    return atan2(y, x) % (2 * pi), atan2(z, hypot(x, y))
+
+
+class EphemerisCache(object):
+    """
+    cache of a function of an ephem date and a key returning a tuple of
+    angles (radians) or other smooth numbers like direction cosines
+
+    the function is sampled at the beginning, the middle and the end of a
+    time window of span seconds and interpolated by a quadratic polynomial;
+    the interpolation is checked at the quarter points and the window is
+    halved until the error is below tolerance arcseconds (if that does not
+    succeed above min_span the function is evaluated directly)
+
+    the interpolation is only set up for a key that has been asked for twice,
+    a key that changes with every call is evaluated directly
+    """
+
+    def __init__(self, function, span=120.0, tolerance=1.0, min_span=5.0):
+        self._function = function
+        self._span = span / 86400.0
+        self._min_span = min_span / 86400.0
+        self._tolerance = tolerance * ephem.degree / 3600.0
+        self._lock = Lock()
+        self.invalidate()
+
+    def invalidate(self):
+        """
+        forget the current interpolation window
+        """
+        self._key = None
+        self._pending = None
+        # start, length and polynomial coefficients of the window
+        self._window = None
+
+    def _polynomial(self, start, span, key):
+        """
+        return the coefficients of the interpolating polynomials or None if
+        the interpolation is not accurate enough
+        """
+        y0, y1, y2 = [
+            self._function(ephem.Date(start + x * span), key) for x in (0.0, 0.5, 1.0)
+        ]
+        coefficients = []
+        for a, b, c in zip(y0, y1, y2):
+            b, c = _unwrap(b, a), _unwrap(c, a)
+            coefficients.append((a, 4 * b - 3 * a - c, 2 * c + 2 * a - 4 * b))
+        for x in (0.25, 0.75):
+            values = self._function(ephem.Date(start + x * span), key)
+            for value, (a, b, c) in zip(values, coefficients):
+                if abs(_unwrap(value, a + b * x + c * x * x) - value) > self._tolerance:
+                    return None
+        return coefficients
+
+    def _build(self, start, key):
+        """
+        set up the interpolation window starting at start
+        """
+        span = self._span
+        while span >= self._min_span:
+            coefficients = self._polynomial(start, span, key)
+            if coefficients is not None:
+                self._window = (start, span, coefficients)
+                return
+            span /= 2
+        logger.debug("no interpolation with sufficient accuracy for %s", key)
+        self._window = (start, self._span, None)
+
+    def __call__(self, date, key=None):
+        """
+        return the (interpolated) function value at the given date
+        """
+        date = float(date)
+        with self._lock:
+            if key != self._key:
+                if key != self._pending:
+                    self._pending = key
+                    return tuple(self._function(ephem.Date(date), key))
+                self._key, self._window = key, None
+            if self._window is None or not (
+                self._window[0] <= date <= self._window[0] + self._window[1]
+            ):
+                self._build(date, key)
+            start, span, coefficients = self._window
+            if coefficients is None:
+                return tuple(self._function(ephem.Date(date), key))
+            x = (date - start) / span
+            return tuple(a + b * x + c * x * x for a, b, c in coefficients)
@@ -0,0 +1,240 @@
+# -*- encoding: utf-8 -*-
+# Copyright: Armin Leuprecht <mir@mur.at> and Stephan Burger <stephan101@gmx.de>
+# License: GNU GPL version 3; http://www.gnu.org/licenses/gpl.txt
+
+"""
+execution of the motions by one long-lived worker per axis
+
+every axis has a queue of jobs that are executed in the order they were
+submitted; a job of several axes occupies all their workers and the worker
+of the lowest axis drives the merged pulse train, so it starts only when
+every axis finished its earlier jobs; the completion of a job is reported
+by its future
+"""
+
+# Standard Library
+import logging
+
+from concurrent.futures import Future
+from queue import Queue
+from sys import maxsize
+from threading import Barrier, Event, Lock, Thread
+
+# Local imports
+from .planner import Move, drive, plan
+
+logger = logging.getLogger(__name__)
+
+
+class Job(object):
+    """
+    a function running on the given axes
+
+    the function is called with a stopped() check as first argument and
+    shall leave as soon as that returns True; the target of a slew takes
+    new angles while it is running
+    """
+
+    def __init__(self, axes, function, args, cancel=None, target=None):
+        self.axes = axes
+        self.function = function
+        self.args = args
+        self.target = target
+        self.future = Future()
+        self.arrived = Barrier(len(axes))
+        self.done = Event()
+        self._stop = Event()
+        self._cancel = cancel
+
+    def stopped(self):
+        return self._stop.is_set() or (
+            self._cancel is not None and self._cancel.is_set()
+        )
+
+    def stop(self):
+        """
+        drop the job if it is queued, stop it if it is running
+        """
+        self.future.cancel()
+        self._stop.set()
+
+    def execute(self):
+        if not self.future.set_running_or_notify_cancel():
+            return
+        try:
+            result = self.function(self.stopped, *self.args)
+        except BaseException as exc:
+            logger.error("motion failed: %s", exc)
+            self.future.set_exception(exc)
+        else:
+            self.future.set_result(result)
+
+
+class Target(object):
+    """
+    new target angles for a running slew
+    """
+
+    def __init__(self):
+        self._angles = None
+        self._closed = False
+        self._lock = Lock()
+
+    def set(self, angles):
+        """
+        set the new angles and return if the slew will still take them
+        """
+        with self._lock:
+            if self._closed:
+                return False
+            self._angles = angles
+            return True
+
+    def take(self):
+        """
+        return the new angles (or None) once
+        """
+        with self._lock:
+            angles, self._angles = self._angles, None
+            return angles
+
+    def close(self):
+        """
+        return the new angles that came too late for the train (or None
+        and take no more angles)
+        """
+        with self._lock:
+            angles, self._angles = self._angles, None
+            self._closed = angles is None
+            return angles
+
+
+class MotionExecutor(object):
+    """
+    queues and workers of the motions of the given motors
+
+    the motors of a job (several axes) must share the same pulse backend
+    """
+
+    def __init__(self, motors):
+        self.motors = motors
+        self._queues = [Queue() for _ in motors]
+        self._jobs = []
+        self._lock = Lock()
+        self._workers = [
+            Thread(target=self._work, args=[axis], daemon=True)
+            for axis in range(len(motors))
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def _work(self, axis):
+        """
+        execute the jobs of the axis
+        """
+        queue = self._queues[axis]
+        while True:
+            job = queue.get()
+            # wait for the workers of the other axes of the job
+            job.arrived.wait()
+            if axis == job.axes[0]:
+                job.execute()
+                with self._lock:
+                    self._jobs.remove(job)
+                job.done.set()
+            else:
+                job.done.wait()
+
+    def submit(self, axes, function, *args, cancel=None, target=None):
+        """
+        queue function(stopped, *args) on the given axes and return its
+        future; the job stops as well when the cancel event is set
+        """
+        job = Job(sorted(axes), function, args, cancel, target)
+        with self._lock:
+            self._jobs.append(job)
+            for axis in job.axes:
+                self._queues[axis].put(job)
+        return job.future
+
+    def move(self, axis, steps, direction, cancel=None):
+        """
+        move the motor of the axis the given steps
+        """
+        motor = self.motors[axis]
+        return self.submit(
+            [axis],
+            lambda stopped: drive(
+                [Move(motor, steps, direction, motor.schedule(steps))],
+                cancel=stopped,
+            ),
+            cancel=cancel,
+        )
+
+    def run(self, axis, direction):
+        """
+        run the motor of the axis until it is stopped
+        """
+        return self.move(axis, maxsize, direction)
+
+    def move_to(self, angles, cancel=None):
+        """
+        move all motors to the given angles so that they arrive together
+
+        the moves are planned when the job starts; until the motors arrived
+        the slew can be redirected by retarget
+        """
+        target = Target()
+
+        def slew(stopped, angles):
+            while angles is not None and not stopped():
+                drive(plan(self.motors, angles), cancel=stopped, retarget=target.take)
+                angles = target.close()
+
+        return self.submit(
+            range(len(self.motors)), slew, angles, cancel=cancel, target=target
+        )
+
+    def retarget(self, angles):
+        """
+        redirect the last unfinished slew to the given angles from the
+        current velocities of the motors; return False if there is none
+        """
+        with self._lock:
+            slews = [job for job in self._jobs if job.target is not None]
+        for job in reversed(slews):
+            if not job.stopped():
+                return job.target.set(angles)
+        return False
+
+    def drive(self, moves, cancel=None, timeline=None):
+        """
+        drive the given moves by one pulse train (continuing the given time
+        line)
+        """
+        axes = [self.motors.index(move.motor) for move in moves]
+        return self.submit(
+            axes,
+            lambda stopped: drive(moves, cancel=stopped, timeline=timeline),
+            cancel=cancel,
+        )
+
+    def stop(self, axes=None):
+        """
+        brake the running jobs of the given axes (all if not given) and drop
+        the queued ones; return their futures
+        """
+        axes = set(range(len(self.motors)) if axes is None else axes)
+        with self._lock:
+            jobs = [job for job in self._jobs if axes.intersection(job.axes)]
+        for job in jobs:
+            job.stop()
+        return [job.future for job in jobs]
+
+    def busy(self, axes=None):
+        """
+        check if any job of the given axes (all if not given) is unfinished
+        """
+        axes = set(range(len(self.motors)) if axes is None else axes)
+        with self._lock:
+            return any(axes.intersection(job.axes) for job in self._jobs)
@@ -0,0 +1,107 @@
+# -*- encoding: utf-8 -*-
+# Copyright: Armin Leuprecht <mir@mur.at> and Stephan Burger <stephan101@gmx.de>
+# License: GNU GPL version 3; http://www.gnu.org/licenses/gpl.txt
+
+"""
+framing of the messages in the byte stream of a connection
+
+every message starts with its size (little endian 16 bit integer); messages
+are at least MIN_SIZE bytes long (shorter ones are padded by the clients)
+
+every message of the server starts with a little endian 32 bit integer,
+its size (including the integer) in the low 24 bits and its type in the
+high 8 bits: the command the response belongs to (status, bulk status or
+subscribe for the notifications); the positions pushed to the stellarium
+clients (16 bit size 24 and 16 bit type 0) are of this form as well, so a
+control client can tell them from its responses
+"""
+
+# Standard Library
+import struct
+
+# First party
+from telescope_server.protocol import command
+
+MIN_SIZE = 20
+MAX_SIZE = 160
+
+_size = struct.Struct("<H")
+_response_header = struct.Struct("<I")
+MAX_RESPONSE_SIZE = (1 << 24) - 1
+
+
+def frame(mtype, payload):
+    """
+    return the payload of a response (bytes) of the given type prefixed by
+    its size and type
+    """
+    size = _response_header.size + len(payload)
+    if size > MAX_RESPONSE_SIZE:
+        raise ValueError("response of %d bytes is too long" % size)
+    return _response_header.pack(size | mtype << 24) + payload
+
+
+class FrameDecoder(object):
+    """
+    reassemble messages from partial reads and split coalesced ones
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def __len__(self):
+        return len(self._buffer)
+
+    def _frame_size(self):
+        """
+        return the size of the first message in the buffer
+        """
+        (size,) = _size.unpack_from(self._buffer)
+        if size > MAX_SIZE:
+            # no sensible size given
+            return MIN_SIZE
+        return max(size, MIN_SIZE)
+
+    def feed(self, data):
+        """
+        add received data and return the list of complete messages
+        """
+        self._buffer += data
+        frames = []
+        while len(self._buffer) >= MIN_SIZE:
+            size = self._frame_size()
+            if len(self._buffer) < size:
+                break
+            frames.append(bytes(self._buffer[:size]))
+            del self._buffer[:size]
+        return frames
+
+
+class ResponseDecoder(object):
+    """
+    split the responses received from the server (for clients)
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def feed(self, data):
+        """
+        add received data and return the list of the complete messages as
+        type and payload (the payload of a position is the whole message)
+        """
+        self._buffer += data
+        messages = []
+        while len(self._buffer) >= _response_header.size:
+            (header,) = _response_header.unpack_from(self._buffer)
+            mtype, size = header >> 24, header & MAX_RESPONSE_SIZE
+            if len(self._buffer) < size:
+                break
+            if mtype == command.STELLARIUM:
+                messages.append((mtype, bytes(self._buffer[:size])))
+            else:
+                messages.append(
+                    (mtype, bytes(self._buffer[_response_header.size : size]))
+                )
+            del self._buffer[:size]
+        return messages
@@ -13,221 +13,359 @@ physical equipment. This class shall be derived from BaseController
 
 # Standard Library
 import logging
+import select
+import socket
 import socketserver
 import subprocess
 
 # from string import replace
-from time import sleep, time
-
-# Third party
-from bitstring import ConstBitStream
+from threading import Lock
 
 # First party
-from telescope_server.protocol import command
+from telescope_server.protocol import command, status
+
+# Local imports
+from . import codec, metrics
+from .broadcast import PositionBroadcaster, StateNotifier
+from .framing import MAX_SIZE, FrameDecoder, frame
 
 logger = logging.getLogger(__name__)
 
 
-class TelescopeRequestHandler(socketserver.BaseRequestHandler):
-    def _stellarium2coords(self, ra_uint, dec_int):
-        return (ra_uint * 12.0 / 2147483648, dec_int * 90.0 / 1073741824)
+class Connection(object):
+    """
+    state of a client connection
+
+    deliver(data) sends data to the client without blocking and drop()
+    closes the connection (see broadcast.Subscriber)
+    """
+
+    def __init__(self, deliver, drop):
+        self.deliver = deliver
+        self.drop = drop
+        self.decoder = FrameDecoder()
+        # subscriptions to the positions and to the state changes
+        self.subscriber = None
+        self.notification = None
+        self.control = False
+
+
+class TelescopeProtocol(object):
+    """
+    execution of the commands in the messages (see codec)
 
-    def _coords2stellarium(self, ra, dec):
-        return (int(ra * (2147483648 / 12.0)), int(dec * (1073741824 / 90.0)))
+    a connection stays open for any number of commands; the status responses
+    are prefixed by their size and type (see framing)
 
-    def _unpack_stellarium(self, data):
+    a control client counts as connected to the controller as long as its
+    connection is open, dead peers are detected by tcp keepalive
+
+    the servers only move the data of the connections, they need the
+    attributes controller, broadcaster and notifier
+    """
+
+    # seconds until the first keepalive probe, between the probes and the
+    # number of unanswered probes until the connection is dead
+    keepalive = (10, 5, 3)
+    # a connection that is idle that long (seconds) receives the positions
+    idle = 0.01
+
+    # open connections and the time to execute a message
+    connections = metrics.registry.gauge("connections")
+    message_time = metrics.registry.histogram("message_us")
+
+    def _keepalive(self, sock):
         """
-        unpack goto data sent by stellarium
+        enable tcp keepalive on the socket of a connection
         """
-        # time
-        data.read("intle:64")
-        # ra
-        ant_pos = data.bitpos
-        data.read("hex:32")
-        data.bitpos = ant_pos
-        ra_uint = data.read("uintle:32")
-        # dec
-        ant_pos = data.bitpos
-        data.read("hex:32")
-        data.bitpos = ant_pos
-        dec_int = data.read("intle:32")
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        for option, value in zip(
+            ["TCP_KEEPIDLE", "TCP_KEEPINTVL", "TCP_KEEPCNT"], self.keepalive
+        ):
+            if hasattr(socket, option):
+                sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
 
-        return self._stellarium2coords(ra_uint, dec_int)
+    def _connect(self, deliver, drop):
+        """
+        return the state of a new connection
+        """
+        self.connections.inc()
+        return Connection(deliver, drop)
 
-    def _pack_stellarium(self, ra, dec):
+    def _disconnect(self, connection):
         """
-        pack given ra (h), dec (degree) together with current time
-        for sending to stellarium
+        cancel the subscriptions of a closed connection
         """
-        ra_s, dec_s = self._coords2stellarium(ra, dec)
-        msize = "0x1800"
-        mtype = "0x0000"
-        localtime = ConstBitStream(f"int:64={int(1e6*time())}")
-        sdata = ConstBitStream(msize) + ConstBitStream(mtype)
-        sdata += ConstBitStream(intle=localtime.intle, length=64)
-        sdata += ConstBitStream(uintle=ra_s, length=32)
-        sdata += ConstBitStream(intle=dec_s, length=32)
-        sdata += ConstBitStream(intle=0, length=32)
-        return sdata
+        self.connections.dec()
+        if connection.subscriber is not None:
+            self.broadcaster.unsubscribe(connection.subscriber)
+        if connection.notification is not None:
+            self.notifier.unsubscribe(connection.notification)
+        if connection.control:
+            self.controller.client_disconnect()
 
-    def _unpack_data(self, data, format):
+    def _idle(self, connection):
         """
-        return unpacked data of type described by format
-        if format is a simple string one value is returned
-        if format is an iteratable a tuple of values is returned
+        subscribe a connection that did not send anything within the idle
+        time to the positions sent to the stellarium clients
         """
-        if isinstance(format, str):
-            ret = data.read(format)
-        else:
-            ret = []
-            for f in format:
-                ret.append(data.read(f))
-            ret = tuple(ret)
-        return ret
+        if not connection.control and connection.subscriber is None:
+            connection.subscriber = self.broadcaster.subscribe(
+                connection.deliver, connection.drop
+            )
 
-    def handle(self):
+    def _subscribe(self, connection, topics):
         """
-        handle requests
+        replace the subscription of the connection to the state changes
         """
-        while True:
-            data0 = ""
-            # set the socket time-out
-            # if nothing is received within this time just send data to the
-            # stellarium server
-            self.request.settimeout(0.01)
-            try:
-                data0 = self.request.recv(160)
-                logger.debug("Input")
-                logger.debug(data0)
-                data = ConstBitStream(bytes=data0, length=160)
-                logger.debug(data)
-                data.read("intle:16")
-                mtype = data.read("intle:16")
-                logger.debug("mtype: %s ", mtype)
-                if mtype == command.STELLARIUM:
-                    # stellarium telescope client
-                    ra, dec = self._unpack_stellarium(data)
-                    self.server.controller.goto(ra, dec)
-
-                elif mtype == command.LOCATION:
-                    # set observer lon/lat/alt given as three floats
-                    lon, lat, alt = self._unpack_data(data, ["floatle:32"] * 3)
-                    try:
-                        self.server.controller.set_observer(lon, lat, alt)
-                    except Exception:
-                        logger.error("could not set location")
-                    break
+        if connection.notification is not None:
+            self.notifier.unsubscribe(connection.notification)
+            connection.notification = None
+        if topics:
+            connection.notification = self.notifier.subscribe(
+                connection.deliver, connection.drop, topics
+            )
 
-                elif mtype == command.START_CAL:
-                    # start calibration
-                    try:
-                        self.server.controller.start_calibration()
-                    except Exception:
-                        logger.error("cannot start calibration")
-                    break
+    def _receive(self, connection, data):
+        """
+        return the commands (type and data) of the messages completed by the
+        received data
 
-                elif mtype == command.STOP_CAL:
-                    # stop calibration
-                    try:
-                        self.server.controller.stop_calibration()
-                    except Exception:
-                        logger.error("cannot stop calibration")
-                    break
+        the subscriptions are handled here, the commands are left to
+        _run
+        """
+        commands = []
+        for data0 in connection.decoder.feed(data):
+            logger.debug("Input")
+            logger.debug(data0)
+            message = self._decode(data0)
+            if message is None:
+                continue
+            mtype, args = message
+            if not connection.control and mtype != command.STELLARIUM:
+                # control clients do not receive the positions
+                connection.control = True
+                self.controller.client_connect()
+                if connection.subscriber is not None:
+                    self.broadcaster.unsubscribe(connection.subscriber)
+                    connection.subscriber = None
+            if mtype == command.SUBSCRIBE:
+                (topics,) = args
+                self._subscribe(connection, topics)
+                continue
+            commands.append(message)
+        return commands
 
-                elif mtype == command.MAKE_STEP:
-                    # make steps (azimuthal/altitudal steps given as two small integers)
-                    azimuth_steps, altitude_steps = self._unpack_data(
-                        data, ["intle:16"] * 2
-                    )
-                    try:
-                        self.server.controller.make_step(azimuth_steps, altitude_steps)
-                    except Exception:
-                        logger.error("cannot make steps")
-                    break
+    def _run(self, mtype, args):
+        """
+        execute a command of _receive, return the response (bytes or None)
+        """
+        try:
+            with self.message_time.time():
+                return self._execute(self.controller, mtype, args)
+        except Exception:
+            logger.error("cannot execute command")
+            return None
 
-                elif mtype == command.START_MOT:
-                    # start or stop motor
-                    motor_id, action, direction = self._unpack_data(
-                        data, ["intle:16"] * 3
-                    )
-                    self.server.controller.start_stop_motor(motor_id, action, direction)
-                    break
+    def _decode(self, data0):
+        """
+        return type and data of the given message (None if it is malformed)
+        """
+        try:
+            return codec.decode(data0)
+        except Exception:
+            logger.error("cannot decode message")
+            return None
 
-                elif mtype == command.SET_ANGLE:
-                    # set the angle of the motors to given object_id (small integer)
-                    # this shall be defined in the controller class
-                    object_id = self._unpack_data(data, "intle:16")
-                    try:
-                        self.server.controller.set_object(object_id)
-                    except Exception:
-                        logger.error("cannot set controller to given object")
-                    break
+    def _status_bulk(self, controller, status_codes):
+        """
+        return the status responses of the given status codes
 
-                elif mtype == command.TOGGLE_TRACK:
-                    # toggle tracking (earth rotation compensation)
-                    try:
-                        self.server.controller.toggle_tracking()
-                    except Exception:
-                        logger.error("cannot toggle tracking")
-                    break
+        the metrics are answered by the server, all others by the controller
+        """
+        responses = iter(
+            controller.get_status_bulk(
+                [code for code in status_codes if code != status.METRICS]
+            )
+        )
+        return [
+            metrics.registry.summary() if code == status.METRICS else next(responses)
+            for code in status_codes
+        ]
 
-                elif mtype == command.APPLY_OBJECT:
-                    # apply the angle of the motors to given object_id (small integer)
-                    # this shall be defined in the controller class
-                    try:
-                        self.server.controller.apply_object()
-                    except Exception:
-                        logger.error("cannot apply controller to given object")
-                    break
+    def _execute(self, controller, mtype, args):
+        """
+        execute the command of the given type with the data of its message
 
-                elif mtype == command.RAS_SHUTDOWN:
-                    # Shutdown Rasberry
-                    try:
-                        subprocess.run("halt", shell=True)
-                    except Exception:
-                        logger.error("cannot shutdown rasberry")
-                    break
+        return the response (bytes or None)
+        """
+        logger.debug("mtype: %s ", mtype)
+        if mtype == command.STELLARIUM:
+            # stellarium telescope client
+            ra, dec = codec.stellarium2coords(*args[1:])
+            controller.goto(ra, dec)
 
-                elif mtype == command.RAS_RESTART:
-                    # Reboot Rasberry
-                    try:
-                        subprocess.run("reboot", shell=True)
-                    except Exception:
-                        logger.error("cannot restart rasberry")
-                    break
+        elif mtype == command.LOCATION:
+            # set observer lon/lat/alt given as three floats
+            lon, lat, alt = args
+            try:
+                controller.set_observer(lon, lat, alt)
+            except Exception:
+                logger.error("could not set location")
 
-                elif mtype == command.TEL_RESTART:
-                    # Reboot Rasberry
-                    try:
-                        subprocess.run(
-                            "systemctl restart telescoped.service", shell=True
-                        )
-                    except Exception:
-                        logger.error("cannot restart telescope-server")
-                    break
+        elif mtype == command.START_CAL:
+            # start calibration
+            try:
+                controller.start_calibration()
+            except Exception:
+                logger.error("cannot start calibration")
 
-                elif mtype == command.STATUS:
-                    # get the status of the controller by status_code (small integer)
-                    status_code = self._unpack_data(data, "intle:16")
-                    try:
-                        response = self.server.controller.get_status(status_code)
-                        logger.debug("response: %s ", response)
-                        self.request.sendall(response.encode())
-                        sleep(0.01)
-                    except Exception as exc:
-                        logger.error(f"{exc} cannot get status of controller")
-                    break
+        elif mtype == command.STOP_CAL:
+            # stop calibration
+            try:
+                controller.stop_calibration()
+            except Exception:
+                logger.error("cannot stop calibration")
+
+        elif mtype == command.MAKE_STEP:
+            # make steps (azimuthal/altitudal steps given as two small integers)
+            azimuth_steps, altitude_steps = args
+            try:
+                controller.make_step(azimuth_steps, altitude_steps)
+            except Exception:
+                logger.error("cannot make steps")
+
+        elif mtype == command.START_MOT:
+            # start or stop motor
+            motor_id, action, direction = args
+            controller.start_stop_motor(motor_id, action, direction)
+
+        elif mtype == command.SET_ANGLE:
+            # set the angle of the motors to given object_id (small integer)
+            # this shall be defined in the controller class
+            (object_id,) = args
+            try:
+                controller.set_object(object_id)
+            except Exception:
+                logger.error("cannot set controller to given object")
+
+        elif mtype == command.TOGGLE_TRACK:
+            # toggle tracking (earth rotation compensation)
+            try:
+                controller.toggle_tracking()
+            except Exception:
+                logger.error("cannot toggle tracking")
+
+        elif mtype == command.APPLY_OBJECT:
+            # apply the angle of the motors to given object_id (small integer)
+            # this shall be defined in the controller class
+            try:
+                controller.apply_object()
+            except Exception:
+                logger.error("cannot apply controller to given object")
+
+        elif mtype == command.RAS_SHUTDOWN:
+            # Shutdown Rasberry
+            try:
+                subprocess.run("halt", shell=True)
+            except Exception:
+                logger.error("cannot shutdown rasberry")
+
+        elif mtype == command.RAS_RESTART:
+            # Reboot Rasberry
+            try:
+                subprocess.run("reboot", shell=True)
+            except Exception:
+                logger.error("cannot restart rasberry")
 
+        elif mtype == command.TEL_RESTART:
+            # Reboot Rasberry
+            try:
+                subprocess.run("systemctl restart telescoped.service", shell=True)
             except Exception:
-                # no data received
-                # send current position
-                ra, dec = self.server.controller.current_pos()
-                sdata = self._pack_stellarium(ra, dec)
+                logger.error("cannot restart telescope-server")
+
+        elif mtype == command.STATUS_BULK:
+            # get the status of the controller for a list of status codes
+            # the responses are separated by tabs
+            try:
+                responses = self._status_bulk(controller, args)
+                logger.debug("responses: %s ", responses)
+                return frame(mtype, "\t".join(responses).encode())
+            except Exception as exc:
+                logger.error("%s cannot get status of controller", exc)
+
+        elif mtype == command.STATUS:
+            # get the status of the controller by status_code (small integer)
+            (status_code,) = args
+            try:
+                if status_code == status.METRICS:
+                    response = metrics.registry.summary()
+                else:
+                    response = controller.get_status(status_code)
+                logger.debug("response: %s ", response)
+                return frame(mtype, response.encode())
+            except Exception as exc:
+                logger.error("%s cannot get status of controller", exc)
+
+        return None
+
+
+class TelescopeRequestHandler(TelescopeProtocol, socketserver.BaseRequestHandler):
+    def _deliver(self, data):
+        """
+        send data to the client if that is possible without blocking
+        """
+        if not self._send_lock.acquire(blocking=False):
+            return False
+        try:
+            _, writable, _ = select.select([], [self.request], [], 0)
+            if not writable:
+                return False
+            self.request.sendall(data)
+            return True
+        finally:
+            self._send_lock.release()
+
+    def _drop(self):
+        """
+        close the connection of a client that does not receive anymore
+        """
+        self.request.shutdown(socket.SHUT_RDWR)
+
+    def handle(self):
+        """
+        handle requests
+        """
+        self._send_lock = Lock()
+        self.controller = self.server.controller
+        self.broadcaster = self.server.broadcaster
+        self.notifier = self.server.notifier
+        connection = self._connect(self._deliver, self._drop)
+        self._keepalive(self.request)
+        # set the socket time-out
+        # if nothing is received within this time the client is subscribed
+        # to the positions sent to the stellarium clients
+        self.request.settimeout(self.idle)
+        try:
+            while True:
                 try:
-                    self.request.send(sdata.bytes)
-                except Exception:
-                    pass
-                sleep(0.5)
+                    data = self.request.recv(MAX_SIZE)
+                except socket.timeout:
+                    self._idle(connection)
+                    self.request.settimeout(None)
+                    continue
+                if not data:
+                    break
+                for mtype, args in self._receive(connection, data):
+                    response = self._run(mtype, args)
+                    if response is not None:
+                        with self._send_lock:
+                            self.request.sendall(response)
+        except OSError:
+            pass
+        finally:
+            self._disconnect(connection)
 
 
 class TelescopeServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
@@ -236,6 +374,12 @@ class TelescopeServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
     # much faster rebinding
     allow_reuse_address = True
 
-    def __init__(self, server_address, controller, RequestHandler):
+    def __init__(self, server_address, controller, RequestHandler, push_rate=2.0):
         socketserver.TCPServer.__init__(self, server_address, RequestHandler)
         self.controller = controller
+        self.broadcaster = PositionBroadcaster(
+            controller, codec.PositionEncoder().encode, push_rate
+        )
+        self.broadcaster.start()
+        self.notifier = StateNotifier(controller)
+        self.notifier.start()
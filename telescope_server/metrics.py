@@ -0,0 +1,196 @@
+# -*- encoding: utf-8 -*-
+# Copyright: Armin Leuprecht <mir@mur.at> and Stephan Burger <stephan101@gmx.de>
+# License: GNU GPL version 3; http://www.gnu.org/licenses/gpl.txt
+
+"""
+lightweight metrics of the hot paths
+
+counters, gauges and histograms are registered once by name in the shared
+registry; recording a value costs a lock and a bisection, the histograms
+keep the counts of fixed buckets only; the registry is rendered as text
+(one "name value" per line) for the metrics endpoint or as a single line
+for the status request
+"""
+
+# Standard Library
+import time
+
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread, active_count
+
+# bucket bounds of durations in microseconds
+DURATION_BUCKETS = tuple(m * 10**e for e in range(1, 7) for m in (1, 5))
+
+
+class Counter(object):
+    """
+    a monotonically increasing count
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.value = 0
+        self._lock = Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def samples(self):
+        yield self.name, self.value
+
+
+class Gauge(object):
+    """
+    a value that goes up and down or is read from a function when rendered
+    """
+
+    def __init__(self, name, function=None):
+        self.name = name
+        self.value = 0
+        self._function = function
+        self._lock = Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set(self, value):
+        self.value = value
+
+    def samples(self):
+        yield self.name, self._function() if self._function else self.value
+
+
+class Histogram(object):
+    """
+    the distribution of observed values in fixed buckets
+
+    bucket i counts the values up to bounds[i], the last one the larger
+    values; the count, sum and maximum are kept as well
+    """
+
+    def __init__(self, name, bounds=DURATION_BUCKETS):
+        self.name = name
+        self.bounds = tuple(bounds)
+        self.buckets = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+        self._lock = Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.bounds, value)
+        with self._lock:
+            self.buckets[index] += 1
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    @contextmanager
+    def time(self):
+        """
+        observe the duration (microseconds) of the with block
+        """
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.observe((time.perf_counter_ns() - start) // 1000)
+
+    def samples(self):
+        with self._lock:
+            buckets, count, total = list(self.buckets), self.count, self.sum
+            maximum = self.max
+        cumulative = 0
+        for bound, value in zip(self.bounds + ("inf",), buckets):
+            cumulative += value
+            yield f"{self.name}_le_{bound}", cumulative
+        yield f"{self.name}_count", count
+        yield f"{self.name}_sum", total
+        yield f"{self.name}_max", maximum
+
+
+class Registry(object):
+    """
+    the metrics by name
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = Lock()
+
+    def _get(self, cls, name, *args):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"metric {name} is a {type(metric).__name__}")
+            return metric
+
+    def counter(self, name):
+        return self._get(Counter, name)
+
+    def gauge(self, name, function=None):
+        return self._get(Gauge, name, function)
+
+    def histogram(self, name, bounds=DURATION_BUCKETS):
+        return self._get(Histogram, name, bounds)
+
+    def samples(self):
+        """
+        yield (name, value) of all metrics sorted by name
+        """
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+        for _, metric in metrics:
+            yield from metric.samples()
+
+    def render(self):
+        """
+        return all metrics as text, one "name value" per line
+        """
+        return "".join(f"{name} {value}\n" for name, value in self.samples())
+
+    def summary(self):
+        """
+        return all metrics in one line ("name=value" separated by semicolons)
+        """
+        return ";".join(f"{name}={value}" for name, value in self.samples())
+
+
+registry = Registry()
+registry.gauge("threads", active_count)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") not in ("", "/metrics"):
+            self.send_error(404)
+            return
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(address):
+    """
+    serve the metrics as text over http in a daemon thread
+    """
+    server = ThreadingHTTPServer(address, _MetricsHandler)
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
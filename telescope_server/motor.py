@@ -4,12 +4,66 @@
 
 # Standard Library
 import logging
-import time
 
+from collections import namedtuple
 from math import cos, pi, pow
+from threading import Lock
 
-# Third party
-from gpiozero import OutputDevice
+# Local imports
+from .planner import Move, drive
+from .pulse import Timeline, default_backend
+from .schedule import Ramp, StepSchedule, brake_schedule, velocity_schedule
+
+
+class MotorState(
+    namedtuple(
+        "MotorState",
+        [
+            "steps",
+            "velocity",
+            "direction",
+            "zero_steps",
+            "zero_angle",
+            "steps_per_rev",
+        ],
+    )
+):
+    """
+    the motion state of a motor: steps (integer), velocity (steps per second,
+    0 at rest) and direction of the last move
+
+    the steps are the position, the angle is derived from them: zero_steps
+    is the step count at the calibrated angle zero_angle
+    """
+
+    __slots__ = ()
+
+    @property
+    def angle(self):
+        if self.steps_per_rev > 0:
+            return (
+                self.zero_angle
+                + (self.steps - self.zero_steps) * 360.0 / self.steps_per_rev
+            ) % 360
+        return self.zero_angle
+
+    def anchored(self, angle=None, steps=None, steps_per_rev=None):
+        """
+        return the state with a new zero at the given angle (the current one
+        if not given) and the given steps and steps per revolution
+        """
+        if angle is None:
+            angle = self.angle
+        if steps is None:
+            steps = self.steps
+        if steps_per_rev is None:
+            steps_per_rev = self.steps_per_rev
+        return self._replace(
+            steps=steps,
+            zero_steps=steps,
+            zero_angle=angle,
+            steps_per_rev=steps_per_rev,
+        )
 
 
 class Motor(object):
@@ -27,6 +81,8 @@ class Motor(object):
         accel_steps=500,
         skewnessbra=0.9,
         bra_steps=500,
+        deadline_timing=True,
+        backend=None,
     ):
         def _accel_velocity(x):
             """
@@ -50,25 +106,30 @@ class Motor(object):
         self.name = name
         self._steps_per_rev = 0
         self._enabled = True
-        self._angle = 0
+        # the state is replaced as a whole (under the lock) so that it can
+        # be read consistently without locking
+        self._state = MotorState(0, 0.0, True, 0, 0, 0)
+        self._state_lock = Lock()
         self._min_angle = min_angle
         self._max_angle = max_angle
-        self._steps = 0
         self._stop = True
         self._delay = 1.0 / vend
         self._positive = positive
         self._brake_steps = accel_steps
-        self.PUL = OutputDevice(pins[0])
-        self.DIR = OutputDevice(pins[1])
-        self.ENBL = OutputDevice(pins[2])
+        self._timeline = Timeline(deadline_timing)
+        self.backend = backend or default_backend()
+        self.PUL, self.DIR, self.ENBL = pins
+        for pin in pins:
+            self.backend.output(pin)
 
-        self._accel_curve = [
-            1.0 / _accel_velocity(_accel_skewing(x)) for x in range(accel_steps)
-        ]
+        # step delays in nanoseconds
+        self._accel_curve = Ramp(
+            int(1e9 / _accel_velocity(_accel_skewing(x))) for x in range(accel_steps)
+        )
         # self._accel_curve = np.linspace(.05, 1./vend, bra_steps)
-        self._bra_curve = [
-            1.0 / _accel_velocity(_bra_skewing(x)) for x in range(bra_steps)
-        ]
+        self._bra_curve = Ramp(
+            int(1e9 / _accel_velocity(_bra_skewing(x))) for x in range(bra_steps)
+        )
         # self._bra_curve = np.linspace(.05, 1./vend, bra_steps)
 
     def __str__(self):
@@ -80,6 +141,9 @@ class Motor(object):
 
     @steps_per_rev.setter
     def steps_per_rev(self, value):
+        # the current angle stays where it is
+        with self._state_lock:
+            self._state = self._state.anchored(steps_per_rev=value)
         self._steps_per_rev = value
         try:
             self._minimum = self._min_angle + 360.0 / value * self._brake_steps
@@ -94,28 +158,37 @@ class Motor(object):
     @enable.setter
     def enable(self, enabled=True):
         self._enabled = enabled
-        if enabled:
-            self.ENBL.on()
-        else:
-            self.ENBL.off()
+        self.backend.write(self.ENBL, enabled)
+
+    @property
+    def state(self):
+        """
+        snapshot of steps, angle, velocity and direction
+        """
+        return self._state
+
+    def _anchor(self, **values):
+        with self._state_lock:
+            self._state = self._state.anchored(**values)
 
     @property
     def angle(self):
-        return self._angle
+        return self._state.angle
 
     @angle.setter
     def angle(self, value):
         value %= 360
         if self._min_angle <= value <= self._max_angle:
-            self._angle = value
+            self._anchor(angle=value)
 
     @property
     def steps(self):
-        return self._steps
+        return self._state.steps
 
     @steps.setter
     def steps(self, value):
-        self._steps = value
+        # the current angle stays where it is
+        self._anchor(steps=value)
 
     @property
     def calibrated(self):
@@ -137,85 +210,131 @@ class Motor(object):
     def delay(self, value):
         self._delay = value
 
-    def brake(self, current_delay, direction):
+    @property
+    def deadline_timing(self):
+        return self._timeline.absolute
+
+    @deadline_timing.setter
+    def deadline_timing(self, value):
+        self._timeline.absolute = value
+
+    @property
+    def worst_late(self):
+        """
+        lateness of the worst step of the last move in seconds
+        """
+        return self._timeline.worst_late * 1e-9
+
+    @property
+    def mean_late(self):
+        """
+        mean lateness of the steps of the last move in seconds
+        """
+        return self._timeline.mean_late * 1e-9
+
+    def limit_reached(self, direction):
+        """
+        check if the motor must not move any further in the given direction
+        """
+        angle = self._state.angle
+        return (angle <= self._minimum and not direction) or (
+            angle >= self._maximum and direction
+        )
+
+    def begin(self, direction, timeline):
+        """
+        prepare a move in the given direction on the given time line
+        """
         self._stop = False
-        accel_index = min(
-            list(range(len(self._bra_curve))),
-            key=lambda i: abs(self._bra_curve[i] - current_delay),
+        self._timeline = timeline
+        self.backend.write(self.DIR, direction)
+
+    def advance(self, count, direction, delay=0):
+        """
+        update the steps by count steps in the given direction at once and
+        set the velocity to the given step delay (0 at rest)
+        """
+        sign = self._positive if direction else -self._positive
+        velocity = 1e9 / delay if delay else 0.0
+        with self._state_lock:
+            self._state = self._state._replace(
+                steps=self._state.steps + sign * count,
+                velocity=velocity,
+                direction=direction,
+            )
+
+    def schedule(self, steps, duration=None, start=0):
+        """
+        return the step schedule for the given steps (lasting the given
+        duration in nanoseconds if possible) starting at the given index of
+        the acceleration curve
+        """
+        return StepSchedule(
+            steps, self._accel_curve, int(self._delay * 1e9), duration, start
         )
-        self.logger.debug("braking down within %d steps", accel_index)
-        for step in range(accel_index):
-            step_delay = self._bra_curve[accel_index - step]
-            self.PUL.on()
-            self.PUL.off()
-            time.sleep(step_delay)
-            self._steps += 2 * (direction - 0.5) * self._positive
-            if self._steps_per_rev > 0:
-                self._angle += (direction - 0.5) * (
-                    self._positive * 720.0 / self._steps_per_rev
-                )
-                self._angle %= 360
-        self.step(accel_index, not direction)
-        self._stop = True
+
+    def accel_index(self, current_delay):
+        """
+        return the index of the acceleration curve that is closest to the
+        given delay (its length at full speed)
+        """
+        return self._accel_curve.index(current_delay)
+
+    def velocity_schedule(self, steps, duration, current_delay=0):
+        """
+        return the delays of the given steps spread over the given duration
+        (nanoseconds) starting at the given step delay (0 at rest) or None if
+        the motor is too far off (see schedule.velocity_schedule)
+        """
+        start = current_delay and self.accel_index(current_delay)
+        return velocity_schedule(
+            self._accel_curve, steps, duration, int(self._delay * 1e9), start
+        )
+
+    def brake_ramp(self, current_delay):
+        """
+        return the number of steps and the delays to brake down from the
+        given delay
+        """
+        index = min(self._bra_curve.index(current_delay), len(self._bra_curve) - 1)
+        return index, brake_schedule(self._bra_curve, index)
+
+    def target_steps(self, angle):
+        """
+        return the steps and direction to move to the given angle
+        """
+        angle = angle % 360
+        if (self._steps_per_rev > 0) and self._enabled:
+            angle_to_move = (angle - self._state.angle) % 360
+            if angle_to_move > 180:
+                angle_to_move = -(360.0 - angle_to_move)
+            steps = self._steps_per_rev * angle_to_move / 360.0
+            return int(abs(round(steps))), self._positive * steps > 0
+        return 0, True
 
     def step(self, steps, direction):
         if steps:
             self.logger.debug(
                 "INPUT -- %s: actual_step/steps/direction: %d / %d / %d",
                 self.name,
-                self._steps,
+                self.steps,
                 steps,
                 direction,
             )
-            self._stop = False
-            if direction:
-                self.DIR.on()
-            else:
-                self.DIR.off()
-                
-            for step in range(steps):
-                try:
-                    step_delay = self._accel_curve[min(step, abs(step - (steps - 1)))]
-                except Exception:
-                    step_delay = self._delay
-
-                if (
-                    self._stop
-                    or (self._angle <= self._minimum and not direction)
-                    or (self._angle >= self._maximum and direction)
-                ):
-                    self.logger.debug(
-                        "BREAK -- %s: actual_step/steps/direction: %d / %d / %d",
-                        self.name,
-                        self._steps,
-                        steps,
-                        direction,
-                    )
-                    self.brake(step_delay, direction)
-                    break
-
-                self.PUL.on()
-                self.PUL.off()
-                time.sleep(step_delay)
-                self._steps += 2 * (direction - 0.5) * self._positive
-                if self._steps_per_rev > 0:
-                    self._angle += (direction - 0.5) * (
-                        self._positive * 720.0 / self._steps_per_rev
-                    )
-                    self._angle %= 360
+            drive([Move(self, steps, direction, self.schedule(steps))])
             self.logger.debug(
                 "END -- %s: actual_step/steps/direction: %d / %d / %d",
                 self.name,
-                self._steps,
+                self.steps,
                 steps,
                 direction,
             )
+            self.logger.debug(
+                "TIMING -- %s: worst/mean step lateness: %d / %d us",
+                self.name,
+                self.worst_late * 1e6,
+                self.mean_late * 1e6,
+            )
 
     def move(self, angle):
-        angle = angle % 360
-        if (self._steps_per_rev > 0) and self._enabled:
-            angle_to_move = (angle - self._angle) % 360
-            if angle_to_move > 180:
-                angle_to_move = -(360.0 - angle_to_move)
-            steps = self._steps_per_rev * angle_to_move / 360.0
-            self.step(int(abs(round(steps))), self._positive * steps > 0)
+        self.step(*self.target_steps(angle))
@@ -0,0 +1,229 @@
+# -*- encoding: utf-8 -*-
+# Copyright: Armin Leuprecht <mir@mur.at> and Stephan Burger <stephan101@gmx.de>
+# License: GNU GPL version 3; http://www.gnu.org/licenses/gpl.txt
+
+"""
+coordinated motion of several motors
+
+the planner turns target angles into step schedules of equal duration so
+that all axes arrive together; a single pulse train drives all of them
+"""
+
+# Standard Library
+import logging
+import time
+
+# Local imports
+from . import metrics
+from .pulse import Timeline
+from .schedule import StepSchedule, chunks, merge, pulses
+
+logger = logging.getLogger(__name__)
+
+# time per step spent in the loop (not waiting for the pulses) and mean
+# lateness of the steps of every chunk of the trains
+_step_time = metrics.registry.histogram("step_us")
+_step_late = metrics.registry.histogram("step_late_us")
+
+
+class Move(object):
+    """
+    the steps of one motor in a given direction along a step schedule
+    """
+
+    def __init__(self, motor, steps, direction, schedule):
+        self.motor = motor
+        self.steps = steps
+        self.direction = direction
+        self.schedule = schedule
+        self.done = 0
+
+
+def plan(motors, angles):
+    """
+    plan the moves of the motors to the given angles
+
+    every motor is limited by its own acceleration curve and end velocity;
+    the faster ones are slowed down to the duration of the slowest one
+    """
+    targets = [motor.target_steps(angle) for motor, angle in zip(motors, angles)]
+    duration = max(
+        motor.schedule(steps).duration for motor, (steps, _) in zip(motors, targets)
+    )
+    return [
+        Move(motor, steps, direction, motor.schedule(steps, duration))
+        for motor, (steps, direction) in zip(motors, targets)
+    ]
+
+
+def replan(moves, angles, timeline):
+    """
+    plan the moves of the motors of the running moves to new angles
+
+    the new moves start at the current velocities of the motors; only if a
+    motor has to turn around or is too fast to stop in time all of them
+    brake down first (without stepping back) and the moves start at rest
+    """
+    motors = [move.motor for move in moves]
+    starts = [
+        move.motor.accel_index(move.schedule.delay(move.done)) if move.done else 0
+        for move in moves
+    ]
+    targets = [motor.target_steps(angle) for motor, angle in zip(motors, angles)]
+    if any(
+        start and (direction != move.direction or steps < start)
+        for move, start, (steps, direction) in zip(moves, starts, targets)
+    ):
+        brakes = []
+        for move, start in zip(moves, starts):
+            if start:
+                _, delays = move.motor.brake_ramp(move.schedule.delay(move.done))
+                brakes.append(Move(move.motor, len(delays), move.direction, delays))
+        drive(brakes, interruptible=False, timeline=timeline)
+        return plan(motors, angles)
+    duration = max(
+        motor.schedule(steps, start=start).duration
+        for motor, start, (steps, _) in zip(motors, starts, targets)
+    )
+    return [
+        Move(motor, steps, direction, motor.schedule(steps, duration, start))
+        for motor, start, (steps, direction) in zip(motors, starts, targets)
+    ]
+
+
+def _delay(move):
+    """
+    return the step delay of the move after its done steps
+    """
+    if isinstance(move.schedule, StepSchedule):
+        return move.schedule.delay(move.done)
+    return move.schedule[min(move.done, len(move.schedule) - 1)]
+
+
+def _current_delay(move):
+    """
+    return the step delay of the move after its done steps (0 at rest)
+    """
+    if not 0 < move.done < move.steps:
+        return 0
+    return _delay(move)
+
+
+def _train(moves, size):
+    """
+    return an iterator of the (delays, masks) chunks of the pulse train of
+    the moves
+
+    the train of several moves is merged before the first pulse is sent
+    """
+    if len(moves) == 1:
+        return ((delays, None) for delays in chunks(moves[0].schedule, size))
+    delays, masks = merge([move.schedule for move in moves])
+    return (
+        (delays[i : i + size], masks[i : i + size]) for i in range(0, len(delays), size)
+    )
+
+
+def _brake(moves, timeline):
+    """
+    brake all motors down together and step back to where they were stopped
+    """
+    for move in moves:
+        move.motor.stop = False
+    brakes = []
+    for move in moves:
+        index, delays = move.motor.brake_ramp(_delay(move))
+        logger.debug("braking %s down within %d steps", move.motor, index)
+        brakes.append((index, delays))
+    drive(
+        [
+            Move(move.motor, len(delays), move.direction, delays)
+            for move, (_, delays) in zip(moves, brakes)
+        ],
+        interruptible=False,
+        timeline=timeline,
+    )
+    drive(
+        [
+            Move(move.motor, index, not move.direction, move.motor.schedule(index))
+            for move, (index, _) in zip(moves, brakes)
+        ],
+        timeline=timeline,
+    )
+    for move in moves:
+        move.motor.stop = True
+
+
+def drive(moves, interruptible=True, timeline=None, cancel=None, retarget=None):
+    """
+    drive the motors of the moves by one pulse train
+
+    all motors must share the same pulse backend; an interruptible train is
+    left as soon as one of the motors is stopped (or the given cancel check
+    returns True) or reaches its limit, then all of them brake down together
+
+    before every chunk of the train retarget() may return new angles, then
+    the moves are replanned from the current velocities and the train
+    continues with the new moves (on the same time line)
+
+    a new time line is started unless the train continues the given one
+    """
+
+    def stopped():
+        for motor in motors:
+            if motor.stop:
+                return True
+        return cancel is not None and cancel()
+
+    check = interruptible and stopped or None
+    while True:
+        planned, moves = moves, [move for move in moves if move.steps]
+        if not moves:
+            return
+        motors = [move.motor for move in moves]
+        backend = motors[0].backend
+        pins = tuple(motor.PUL for motor in motors)
+        if timeline is None:
+            timeline = Timeline(motors[0].deadline_timing)
+            timeline.start(backend.now())
+        for move in moves:
+            move.motor.begin(move.direction, timeline)
+
+        for delays, masks in _train(moves, backend.chunk_size):
+            start, slept = time.perf_counter_ns(), timeline.slept
+            angles = retarget and retarget()
+            if angles is not None:
+                logger.debug("RETARGET -- %s", angles)
+                moves = replan(planned, angles, timeline)
+                break
+            count = 0
+            if not (
+                interruptible
+                and (
+                    stopped()
+                    or any(move.motor.limit_reached(move.direction) for move in moves)
+                )
+            ):
+                late = timeline.total_late
+                count = backend.train(pins, delays, timeline, masks, check)
+                for axis, move in enumerate(moves):
+                    done = pulses(masks, count, axis)
+                    move.done += done
+                    move.motor.advance(done, move.direction, _current_delay(move))
+                if count:
+                    busy = time.perf_counter_ns() - start - (timeline.slept - slept)
+                    _step_time.observe(busy // count // 1000)
+                    _step_late.observe((timeline.total_late - late) // count // 1000)
+            if count < len(delays):
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(
+                        "BREAK -- %s",
+                        ", ".join(
+                            "%s: %d / %d" % (move.motor, move.done, move.steps)
+                            for move in moves
+                        ),
+                    )
+                _brake(moves, timeline)
+                return
+        else:
+            return
@@ -73,7 +73,7 @@ class Led(object):
                                 struct.pack("256s", "wlan0"[:15]),
                             )[20:24]
                         )
-                        self.logger.debug(f"ipnummer {ipnummer}")
+                        self.logger.debug("ipnummer %s", ipnummer)
                         self._blink_delayshort = 1
                         self._blink_delaylong = 1
                     except Exception:
@@ -61,10 +61,10 @@ class Manual(object):
                     # stop and eventually start in the opposite direction
                     current[motor] = c
                     self.controller.start_stop_motor(motor, False, True)
-                    self.logger.debug(f"stop motor {motor}")
+                    self.logger.debug("stop motor %s", motor)
                     if c[0]:
                         self.controller.start_stop_motor(motor, True, c[1])
-                        self.logger.debug(f"start in direction {c[1]}")
+                        self.logger.debug("start in direction %s", c[1])
 
             sleep(0.05)
 
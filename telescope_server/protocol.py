@@ -20,6 +20,8 @@ class command:
     RAS_SHUTDOWN = 9
     RAS_RESTART = 10
     TEL_RESTART = 11
+    SUBSCRIBE = 12
+    STATUS_BULK = 98
     STATUS = 99
 
 
@@ -35,4 +37,15 @@ class status:
     ALT_ANGLES = 12
     SIGHTED_OBJ = 13
     CURR_STEPS = 20
+    STEP_LATE = 21
     VISIBLE_OBJ = 30
+    NEAREST_OBJ = 31
+    FIELD_OBJ = 32
+    METRICS = 40
+
+
+class topic:
+    TRACKING = 1
+    MOTORRUN = 2
+    CALIBRATION = 4
+    POSITION = 8
@@ -0,0 +1,511 @@
+# -*- encoding: utf-8 -*-
+# Copyright: Armin Leuprecht <mir@mur.at> and Stephan Burger <stephan101@gmx.de>
+# License: GNU GPL version 3; http://www.gnu.org/licenses/gpl.txt
+
+"""
+pulse generators for the stepper motor drivers
+
+a backend gets a whole precomputed pulse train (see schedule.py) in one call;
+the pigpio backend hands it to the DMA waveform generator of the pigpio
+daemon, the gpio backend bit-bangs it with gpiozero and the mock backend
+only records the timeline
+"""
+
+# Standard Library
+import logging
+import time
+
+from array import array
+from collections import deque
+from threading import Condition, Event, Thread
+
+# Third party
+import numpy as np
+
+from gpiozero import OutputDevice
+
+try:
+    # Third party
+    import pigpio
+except ImportError:
+    pigpio = None
+
+logger = logging.getLogger(__name__)
+
+
+class Timeline(object):
+    """
+    time line of the pulse trains of one caller
+
+    with absolute timing every pulse is scheduled against an absolute
+    deadline; the lateness of the pulses and the time spent waiting for
+    them are collected for statistics
+    """
+
+    def __init__(self, absolute=True):
+        self.absolute = absolute
+        self.deadline = 0
+        self.pulses = 0
+        self.total_late = 0
+        self.worst_late = 0
+        self.slept = 0
+
+    def start(self, now):
+        """
+        anchor the time line at now (nanoseconds) and reset the statistics
+        """
+        self.deadline = now
+        self.pulses = 0
+        self.total_late = 0
+        self.worst_late = 0
+        self.slept = 0
+
+    def merge(self, other):
+        """
+        add the statistics of another time line
+        """
+        self.pulses += other.pulses
+        self.total_late += other.total_late
+        self.worst_late = max(self.worst_late, other.worst_late)
+        self.slept += other.slept
+
+    @property
+    def mean_late(self):
+        return self.pulses and self.total_late / self.pulses
+
+
+class PulseBackend(object):
+    """
+    base class of the pulse generators
+
+    pins are given by their BCM number; a pulse train is given by the delays
+    (nanoseconds) after each pulse and optional masks that select the pins
+    (bit j for pins[j]) pulsed at each step
+    """
+
+    # number of pulses handed to the backend at once
+    chunk_size = 256
+
+    def now(self):
+        return time.perf_counter_ns()
+
+    def output(self, pin):
+        """
+        set up the given pin as output
+        """
+        raise NotImplementedError
+
+    def write(self, pin, level):
+        """
+        set the given output pin to level
+        """
+        raise NotImplementedError
+
+    def train(self, pins, delays, timeline, masks=None, cancel=None):
+        """
+        send a pulse train and return the number of pulses actually sent
+
+        the train is left early as soon as the cancel callable returns True;
+        the time spent waiting for the pulses is added to timeline.slept
+        """
+        raise NotImplementedError
+
+
+class GpioBackend(PulseBackend):
+    """
+    software pulse generation with gpiozero (the fallback)
+    """
+
+    def __init__(self):
+        self._devices = {}
+
+    def output(self, pin):
+        if pin not in self._devices:
+            self._devices[pin] = OutputDevice(pin)
+
+    def write(self, pin, level):
+        if level:
+            self._devices[pin].on()
+        else:
+            self._devices[pin].off()
+
+    def train(self, pins, delays, timeline, masks=None, cancel=None):
+        devices = [self._devices[pin] for pin in pins]
+        now = time.perf_counter_ns
+        if not timeline.absolute:
+            for count, step_delay in enumerate(delays):
+                if cancel and cancel():
+                    return count
+                for j, device in enumerate(devices):
+                    if masks is None or masks[count] >> j & 1:
+                        device.on()
+                        device.off()
+                start = now()
+                time.sleep(step_delay * 1e-9)
+                timeline.slept += now() - start
+            return len(delays)
+
+        # every pulse is scheduled against an absolute deadline so that the
+        # time spent on the pins and the bookkeeping does not add up
+        deadline = timeline.deadline
+        total, worst, slept = timeline.total_late, timeline.worst_late, 0
+        count = len(delays)
+        for index, step_delay in enumerate(delays):
+            if cancel and cancel():
+                count = index
+                break
+            late = now() - deadline
+            for j, device in enumerate(devices):
+                if masks is None or masks[index] >> j & 1:
+                    device.on()
+                    device.off()
+            total += late
+            if late > worst:
+                worst = late
+            if late > step_delay:
+                # more than a whole step behind (e.g. the thread was not
+                # scheduled): restart from now instead of catching up in a burst
+                deadline += late
+            deadline += step_delay
+            start = now()
+            wait = deadline - start
+            if wait > 0:
+                time.sleep(wait * 1e-9)
+                slept += now() - start
+        timeline.deadline = deadline
+        timeline.pulses += count
+        timeline.total_late, timeline.worst_late = total, worst
+        timeline.slept += slept
+        return count
+
+
+class _Submission(object):
+    """
+    a pulse train handed to the transmitter of the pigpio backend
+
+    times are the absolute times (nanoseconds) of the pulses and bits the
+    gpio bits pulsed at each of them; next is the number of pulses put into
+    waveforms so far, first the one before the current window; count is
+    the number of pulses sent as soon as the train is done
+    """
+
+    def __init__(self, pins, delays, masks, cancel, start, absolute):
+        self.delays = np.asarray(delays, dtype=np.int64)
+        self.times = np.cumsum(self.delays) - self.delays + start
+        if masks is None:
+            self.bits = np.full(len(self.delays), sum(1 << pin for pin in pins))
+        else:
+            masks = np.frombuffer(bytes(masks), dtype=np.uint8).astype(np.int64)
+            self.bits = sum(((masks >> j) & 1) << pin for j, pin in enumerate(pins))
+        self.cancel = cancel
+        self.absolute = absolute
+        self.first = self.next = self.count = 0
+        # delay of the pulses not yet sent and the lateness of the sent ones
+        self.shift = 0
+        self.total_late = 0
+        self.worst_late = 0
+        self.done = Event()
+
+    def slip(self, delay, index):
+        """
+        delay the pulses from the given index on
+        """
+        self.times[index:] += delay
+        if self.absolute and not self.done.is_set():
+            self.shift += delay
+            self.late(self.next - index)
+
+    def late(self, pulses):
+        """
+        count the lateness of the given number of pulses
+        """
+        if self.absolute and pulses > 0:
+            self.total_late += self.shift * pulses
+            self.worst_late = max(self.worst_late, self.shift)
+
+    def release(self):
+        """
+        finish the train, all its pulses will be sent
+        """
+        self.late(len(self.times) - self.next)
+        self.count = len(self.times)
+        self.done.set()
+
+    def take(self, end):
+        """
+        return the times and bits of the next pulses before end
+        """
+        self.first = self.next
+        self.next = np.searchsorted(self.times, end)
+        if not self.done.is_set():
+            self.late(self.next - self.first)
+        return (
+            self.times[self.first : self.next],
+            self.bits[self.first : self.next],
+        )
+
+
+class PigpioBackend(PulseBackend):
+    """
+    hardware timed pulse generation by the DMA waveforms of the pigpio daemon
+
+    the daemon transmits one waveform at a time, thus the trains of all
+    callers are merged by one transmitter thread into a chain of short
+    waveforms (window seconds each); the next waveform is built while the
+    current one is sent and starts right after it without a gap
+
+    a train is handed back to its caller before the waveform with its last
+    pulses is built, and the waveform waits for the train that follows; a
+    cancelled train stops after the waveforms already queued (up to two
+    windows)
+    """
+
+    chunk_size = 2048
+    # width of a pulse in microseconds
+    pulse_width = 5
+    # duration of the waveforms and time to set up the first one (seconds)
+    window = 0.02
+    setup = 0.002
+    # polling interval while a waveform is transmitted
+    poll = 0.001
+
+    def __init__(self, pi):
+        self._pi = pi
+        self._cond = Condition()
+        self._submissions = []
+        # end of the last pulse put into a waveform
+        self._committed = 0
+        self._thread = None
+
+    def output(self, pin):
+        self._pi.set_mode(pin, pigpio.OUTPUT)
+
+    def write(self, pin, level):
+        # the pulses in the queued waveforms are sent with the former levels
+        with self._cond:
+            wait = self._committed - self.now()
+        if wait > 0:
+            time.sleep(wait * 1e-9)
+        self._pi.write(pin, int(bool(level)))
+
+    def train(self, pins, delays, timeline, masks=None, cancel=None):
+        if not len(delays):
+            return 0
+        submission = _Submission(
+            pins, delays, masks, cancel, timeline.deadline, timeline.absolute
+        )
+        start = time.perf_counter_ns()
+        with self._cond:
+            if self._thread is None:
+                self._thread = Thread(target=self._transmit, daemon=True)
+                self._thread.start()
+            self._submissions.append(submission)
+            self._cond.notify()
+        submission.done.wait()
+        timeline.slept += time.perf_counter_ns() - start
+        count = submission.count
+        if count:
+            timeline.deadline = int(
+                submission.times[count - 1] + submission.delays[count - 1]
+            )
+        timeline.pulses += count
+        timeline.total_late += submission.total_late
+        timeline.worst_late = max(timeline.worst_late, submission.worst_late)
+        return count
+
+    def _waveform(self, start, times, bits):
+        """
+        translate the pulses at the given times of the window from start to
+        pigpio pulses
+        """
+        width = self.pulse_width
+        pulses = []
+        last = 0
+        # the pulses are placed at their micros from the start of the window
+        # (pulses closer than their width are sent as one)
+        micros = np.maximum((times - start) // 1000, 0)
+        for offset, gpios in zip(micros.tolist(), bits.tolist()):
+            if pulses and offset < last + width:
+                pulses[-2].gpio_on |= gpios
+                pulses[-1].gpio_off |= gpios
+                continue
+            if pulses:
+                pulses[-1].delay = offset - last - width
+            elif offset:
+                pulses.append(pigpio.pulse(0, 0, offset))
+            pulses.append(pigpio.pulse(gpios, 0, width))
+            pulses.append(pigpio.pulse(0, gpios, 0))
+            last = offset
+        end = int(self.window * 1e6)
+        if pulses:
+            pulses[-1].delay = end - last - width
+        else:
+            pulses.append(pigpio.pulse(0, 0, end))
+        return pulses
+
+    def _reap(self, waves):
+        """
+        delete the waveforms that have been sent
+        """
+        current = self._pi.wave_tx_at()
+        ids = [wave for wave, _ in waves]
+        for _ in range(ids.index(current) if current in ids else len(ids)):
+            self._pi.wave_delete(waves.popleft()[0])
+
+    def _prepare(self, start, end, until):
+        """
+        line the submissions up for the window from start to end
+
+        trains that missed the chain restart at its start; the trains that
+        end in the window are handed back and their callers may submit the
+        trains that follow them until the given time
+        """
+        width = self.pulse_width * 1000
+        while True:
+            released = 0
+            submissions = []
+            for submission in self._submissions:
+                if not submission.done.is_set():
+                    if submission.cancel and submission.cancel():
+                        submission.count = submission.next
+                        submission.done.set()
+                        continue
+                    behind = start - submission.times[submission.next]
+                    if behind > width:
+                        # restart from the chain instead of catching up in a burst
+                        submission.slip(behind, submission.next)
+                    if submission.times[-1] < end:
+                        submission.release()
+                        self._committed = max(
+                            self._committed, int(submission.times[-1]) + width
+                        )
+                        released += 1
+                submissions.append(submission)
+            self._submissions = submissions
+            if not released:
+                return
+            waiting = len(self._submissions) + released
+            self._cond.wait_for(
+                lambda: len(self._submissions) >= waiting,
+                max((until - self.now()) * 1e-9, 0),
+            )
+
+    def _transmit(self):
+        """
+        send the pulses of all submissions in a chain of waveforms
+        """
+        window = int(self.window * 1e9)
+        # the pulses of a window end before it by their width
+        width = self.pulse_width * 1000
+        setup = int(self.setup * 1e9)
+        # waveforms in transmission: (wave id, end)
+        waves = deque()
+        while True:
+            with self._cond:
+                if waves:
+                    self._reap(waves)
+                if not self._submissions:
+                    self._cond.wait(self.window if waves else None)
+                    continue
+                now = self.now()
+                if len(waves) > 1:
+                    # the next waveform is queued already
+                    self._cond.wait(max((waves[0][1] - now) * 1e-9, self.poll))
+                    continue
+                start = waves[-1][1] if waves else now + setup
+                end = start + window - width
+                self._prepare(start, end, start - setup)
+                submissions = self._submissions
+                pulses = [s.take(end) for s in submissions]
+                self._submissions = [s for s in submissions if s.next < len(s.times)]
+                if pulses:
+                    times = np.concatenate([t for t, _ in pulses])
+                    bits = np.concatenate([b for _, b in pulses])
+                    order = np.argsort(times, kind="stable")
+                    times, bits = times[order], bits[order]
+                else:
+                    times = bits = np.zeros(0, dtype=np.int64)
+                if len(times):
+                    self._committed = max(self._committed, int(times[-1]) + width)
+            self._pi.wave_add_generic(self._waveform(start, times, bits))
+            wave = self._pi.wave_create()
+            if not waves:
+                wait = start - self.now()
+                if wait > 0:
+                    time.sleep(wait * 1e-9)
+            self._pi.wave_send_using_mode(wave, pigpio.WAVE_MODE_ONE_SHOT_SYNC)
+            late = self.now() - start
+            if not waves and late > 0:
+                # the chain was empty and the waveform starts late
+                with self._cond:
+                    for submission in submissions:
+                        submission.slip(late, submission.first)
+                    self._committed += late
+                start += late
+            waves.append((wave, start + window))
+
+
+class MockBackend(PulseBackend):
+    """
+    backend without hardware that records the emitted timeline
+
+    time does not pass in reality, pulses are recorded at their scheduled
+    (virtual) time in nanoseconds
+    """
+
+    def __init__(self):
+        self.levels = {}
+        self.times = array("q")
+        self.pins = array("B")
+        self._now = 0
+
+    def now(self):
+        return self._now
+
+    def output(self, pin):
+        self.levels.setdefault(pin, 0)
+
+    def write(self, pin, level):
+        self.levels[pin] = int(bool(level))
+
+    def train(self, pins, delays, timeline, masks=None, cancel=None):
+        now = max(self._now, timeline.deadline)
+        count = len(delays)
+        for index, step_delay in enumerate(delays):
+            if cancel and cancel():
+                count = index
+                break
+            for j, pin in enumerate(pins):
+                if masks is None or masks[index] >> j & 1:
+                    self.times.append(now)
+                    self.pins.append(pin)
+            now += step_delay
+        timeline.pulses += count
+        timeline.deadline = self._now = now
+        return count
+
+    def clear(self):
+        """
+        forget the recorded timeline
+        """
+        del self.times[:]
+        del self.pins[:]
+
+
+_default_backend = None
+
+
+def default_backend():
+    """
+    return the shared backend: pigpio if its daemon is reachable, gpio otherwise
+    """
+    global _default_backend
+    if _default_backend is None:
+        if pigpio is not None:
+            pi = pigpio.pi()
+            if pi.connected:
+                _default_backend = PigpioBackend(pi)
+        if _default_backend is None:
+            logger.info("pigpio daemon not available: use gpio pulse backend")
+            _default_backend = GpioBackend()
+    return _default_backend
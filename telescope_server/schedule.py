@@ -0,0 +1,301 @@
+# -*- encoding: utf-8 -*-
+# Copyright: Armin Leuprecht <mir@mur.at> and Stephan Burger <stephan101@gmx.de>
+# License: GNU GPL version 3; http://www.gnu.org/licenses/gpl.txt
+
+"""
+precomputed step schedules for the stepper motors
+
+the delays of a whole move are worked out before the first pulse is sent
+so that the pulse loop only has to toggle the pin and sleep
+"""
+
+# Standard Library
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate, chain
+
+# Third party
+import numpy as np
+
+
+class Ramp(object):
+    """
+    step delays of an acceleration (or brake) curve from rest to full speed
+
+    the delays are monotonically decreasing (increasing velocity), thus the
+    entry of any velocity is found by bisection; the prefix sums give the
+    duration of any part of the ramp
+    """
+
+    def __init__(self, delays):
+        self.delays = array("q", delays)
+        # ascending delays for bisect and ramping down
+        self._ascending = array("q", reversed(self.delays))
+        self.sums = [0] + list(accumulate(self.delays))
+        for slower, faster in zip(self.delays, self.delays[1:]):
+            if faster > slower:
+                raise ValueError("ramp delays must not increase")
+
+    def __len__(self):
+        return len(self.delays)
+
+    def __getitem__(self, index):
+        return self.delays[index]
+
+    def __iter__(self):
+        return iter(self.delays)
+
+    def down(self, start, stop=0):
+        """
+        return the delays of the entries before start down to stop in
+        reverse order (ramping down)
+        """
+        count = len(self.delays)
+        return self._ascending[count - start : count - stop]
+
+    def index(self, delay):
+        """
+        return the index of the entry closest to the given delay or the
+        length of the ramp if the delay is as short as its last one or
+        shorter (full speed)
+        """
+        count = len(self.delays)
+        if not count or delay <= self.delays[-1]:
+            return count
+        position = bisect_left(self._ascending, delay)
+        if position == count:
+            return 0
+        # the closer of the neighbouring entries (the slower one on a tie)
+        if position and delay - self._ascending[position - 1] < (
+            self._ascending[position] - delay
+        ):
+            position -= 1
+        # the first entry of equal delays
+        return count - bisect_right(self._ascending, self._ascending[position])
+
+
+class StepSchedule(object):
+    """
+    delay profile of a move with a given number of steps
+
+    the motor ramps up along the acceleration curve, cruises with the
+    given delay and ramps down along the reversed acceleration curve;
+    moves that are too short to reach full speed turn around in the middle
+
+    if a duration is given the move is slowed down to last that long: the
+    ramp is only climbed as far as necessary and the cruise delay is
+    stretched accordingly
+
+    a move that starts in motion (at the given index of the ramp) climbs the
+    rest of the ramp only and ramps down to rest as usual; it is never slowed
+    down below the velocity it starts with (the steps must suffice to ramp
+    down from there)
+
+    the delay after the last step is always the first one of the ramp (at
+    rest), so that the last steps of moves of equal duration coincide even
+    if some of them do not climb the ramp at all
+
+    the ramp is a Ramp or any sequence of delays; all delays are integer
+    nanoseconds
+    """
+
+    def __init__(self, steps, ramp, cruise_delay, duration=None, start=0):
+        if isinstance(ramp, Ramp):
+            sums = ramp.sums
+        else:
+            sums = [0] + list(accumulate(ramp))
+
+        def level(peak):
+            """
+            delay after climbing the ramp by peak steps
+            """
+            return ramp[peak] if peak < len(ramp) else cruise_delay
+
+        def length(peak):
+            """
+            duration of the move when climbing the ramp up to peak
+            """
+            return (
+                2 * sums[peak] - sums[start] + (steps + start - 2 * peak) * level(peak)
+            )
+
+        peak = max(min(len(ramp), (steps + start) // 2), start)
+        if duration is not None and length(peak) < duration:
+            # lowest peak that is still fast enough
+            low, high = start, peak
+            while low < high:
+                middle = (low + high) // 2
+                if length(middle) <= duration:
+                    high = middle
+                else:
+                    low = middle + 1
+            peak = low
+        # a move that does not climb the ramp still ends at rest
+        bottom = peak or int(steps > 1 and len(ramp) > 0)
+        self.steps = steps
+        self.up = array("q", ramp[start:peak])
+        if isinstance(ramp, Ramp):
+            self.down = ramp.down(bottom)
+        else:
+            self.down = array("q", reversed(ramp[:bottom]))
+        self.cruise_steps = max(steps - len(self.up) - len(self.down), 0)
+        self.cruise_delay = level(peak)
+        if duration is not None and self.cruise_steps and not start:
+            self.cruise_delay = max(
+                self.cruise_delay,
+                (duration - sums[peak] - sums[bottom]) // self.cruise_steps,
+            )
+        self.duration = (
+            sums[peak]
+            + sums[bottom]
+            - sums[start]
+            + self.cruise_steps * self.cruise_delay
+        )
+
+    def __len__(self):
+        return self.steps
+
+    def __iter__(self):
+        return chain.from_iterable(self.chunks(256))
+
+    def delay(self, step):
+        """
+        return the delay after the given step
+        """
+        if step < len(self.up):
+            return self.up[step]
+        step -= len(self.up)
+        if step < self.cruise_steps or not self.down:
+            return self.cruise_delay
+        return self.down[min(step - self.cruise_steps, len(self.down) - 1)]
+
+    def chunks(self, size):
+        """
+        yield the step delays in arrays of at most size entries
+
+        the cruise phase is generated lazily so that even endless moves
+        (e.g. sys.maxsize steps) do not allocate more than one chunk
+        """
+        for i in range(0, len(self.up), size):
+            yield self.up[i : i + size]
+        full, rest = divmod(self.cruise_steps, size)
+        if full:
+            block = array("q", [self.cruise_delay]) * size
+            for _ in range(full):
+                yield block
+        if rest:
+            yield array("q", [self.cruise_delay]) * rest
+        for i in range(0, len(self.down), size):
+            yield self.down[i : i + size]
+
+
+def brake_schedule(ramp, index):
+    """
+    return the delays to ramp down from the given index of the ramp to rest
+    """
+    if isinstance(ramp, Ramp):
+        return ramp.down(index + 1, 1)
+    return array("q", reversed(ramp[1 : index + 1]))
+
+
+def velocity_schedule(ramp, steps, duration, min_delay, start=0):
+    """
+    return the delays of the given steps spread over the given duration
+    (nanoseconds) for a motor in motion at the given index of the ramp (0 at
+    rest) or None if it is too far off (more steps than the ramp is long)
+
+    the motor moves along the ramp (up or down) to the rate that makes up
+    the duration and keeps that rate, it does not end at rest; if it cannot
+    slow down within the steps it ends early, if it cannot get that fast in
+    time it climbs the ramp as far as it gets and fewer steps are returned
+    """
+    if not steps:
+        return array("q")
+    if steps > len(ramp):
+        return None
+    end = ramp.index(duration // steps)
+    for _ in range(3):
+        if end < start:
+            delays = ramp.down(start, end)
+            if len(delays) >= steps:
+                return delays[:steps]
+        else:
+            delays = ramp[start:end]
+        cruise = steps - len(delays)
+        rest = duration - sum(delays)
+        if cruise <= 0 or rest <= 0:
+            break
+        delay = rest // cruise
+        if ramp.index(delay) == end:
+            if delay < min_delay:
+                break
+            return array("q", delays) + array("q", [delay]) * cruise
+        end = ramp.index(delay)
+    top = bisect_right(ramp.sums, ramp.sums[start] + duration) - 1
+    delays = array("q", ramp[start:top])
+    if top == len(ramp):
+        delays += array("q", [min_delay]) * (
+            (duration - ramp.sums[top] + ramp.sums[start]) // min_delay
+        )
+    return delays[:steps]
+
+
+def chunks(train, size):
+    """
+    yield the delays of a step schedule or a plain array of delays in arrays
+    of at most size entries
+    """
+    if isinstance(train, StepSchedule):
+        yield from train.chunks(size)
+    else:
+        for i in range(0, len(train), size):
+            yield train[i : i + size]
+
+
+def delay_array(train):
+    """
+    return the delays of a step schedule or a plain array of delays as numpy
+    array
+    """
+    if isinstance(train, StepSchedule):
+        return np.concatenate(
+            [
+                np.asarray(train.up, dtype=np.int64),
+                np.full(train.cruise_steps, train.cruise_delay, dtype=np.int64),
+                np.asarray(train.down, dtype=np.int64),
+            ]
+        )
+    return np.asarray(train, dtype=np.int64)
+
+
+def merge(trains):
+    """
+    merge the step delays of several axes into one pulse train
+
+    the first pulses of all axes are sent at the same time; the whole train
+    is computed at once: the pulse times of every axis are the cumulated
+    delays and the merged train has a step at every distinct time; return
+    the delays and the masks of the steps where bit j of a mask marks a
+    pulse of axis j
+    """
+    axes = [delay_array(train) for train in trains]
+    times = [np.cumsum(d) - d for d in axes]
+    # the times of every axis are sorted runs, which a stable sort merges
+    steps = np.sort(np.concatenate(times), kind="stable")
+    steps = steps[np.diff(steps, prepend=-1) != 0]
+    masks = np.zeros(len(steps), dtype=np.uint8)
+    for j, t in enumerate(times):
+        masks[np.searchsorted(steps, t)] |= 1 << j
+    end = max((t[-1] + d[-1] for t, d in zip(times, axes) if len(d)), default=0)
+    merged = np.diff(steps, append=end)
+    return array("q", merged.tobytes()), bytearray(masks.tobytes())
+
+
+def pulses(masks, count, axis):
+    """
+    return the number of pulses of the given axis among the first count masks
+    """
+    if masks is None:
+        return count
+    masks = masks[:count]
+    return sum(masks.count(m) for m in set(masks) if m >> axis & 1)
@@ -0,0 +1,36 @@
+# -*- encoding: utf-8 -*-
+# Copyright: Armin Leuprecht <mir@mur.at> and Stephan Burger <stephan101@gmx.de>
+# License: GNU GPL version 3; http://www.gnu.org/licenses/gpl.txt
+
+"""
+the telescope controller on simulated motor drivers
+
+no hardware is needed: the pulses go to a simulated backend and the
+controller runs on its virtual clock; SIM_SPEED is the speed of the virtual
+time as multiple of the real time (0: as fast as possible)
+"""
+
+# Standard Library
+import os
+
+from datetime import datetime, timedelta
+
+# Local imports
+from . import controller
+from .simulation import SimulatedBackend, VirtualClock
+
+
+class Controller(controller.Controller):
+    def __init__(self, speed=None, catalogues=()):
+        if speed is None:
+            speed = float(os.environ.get("SIM_SPEED", 1.0))
+        self.clock = VirtualClock(speed)
+        self.backend = SimulatedBackend(self.clock)
+        self._epoch = datetime.utcnow()
+        super().__init__(catalogues)
+
+    def _utcnow(self):
+        return self._epoch + timedelta(microseconds=self.clock.now() // 1000)
+
+    def _wait(self, event, timeout):
+        return self.clock.wait(event, timeout)
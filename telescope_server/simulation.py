@@ -0,0 +1,122 @@
+# -*- encoding: utf-8 -*-
+# Copyright: Armin Leuprecht <mir@mur.at> and Stephan Burger <stephan101@gmx.de>
+# License: GNU GPL version 3; http://www.gnu.org/licenses/gpl.txt
+
+"""
+simulation of the motor drivers on a virtual clock
+
+the pulses are not sent to any hardware but recorded at their virtual time;
+the virtual time runs as fast as possible or at a given multiple of the
+real time, so slews and tracking can be replayed in seconds
+"""
+
+# Standard Library
+import time
+
+from collections import Counter
+from threading import Lock
+
+# Local imports
+from .pulse import MockBackend
+
+
+class VirtualClock(object):
+    """
+    virtual time in nanoseconds
+
+    with a speed the virtual time runs at speed times the real time: it
+    passes on its own and cannot run ahead of it (waits are spent in
+    reality); without a speed (0) the virtual time only jumps ahead
+    """
+
+    def __init__(self, speed=0):
+        self.speed = speed
+        self._now = 0
+        self._origin = time.perf_counter_ns()
+        self._lock = Lock()
+
+    def now(self):
+        if self.speed:
+            real = int((time.perf_counter_ns() - self._origin) * self.speed)
+            return max(self._now, real)
+        return self._now
+
+    def advance_to(self, virtual):
+        """
+        let the virtual time pass until the given time
+        """
+        with self._lock:
+            self._now = max(self._now, virtual)
+        if self.speed:
+            delay = self._origin + virtual / self.speed - time.perf_counter_ns()
+            if delay > 0:
+                time.sleep(delay * 1e-9)
+
+    def sleep(self, seconds):
+        self.advance_to(self.now() + int(seconds * 1e9))
+
+    def wait(self, event, timeout):
+        """
+        wait until the event is set or the timeout (seconds) passed in
+        virtual time
+        """
+        start = self.now()
+        if self.speed:
+            event.wait(timeout / self.speed)
+        if not event.is_set():
+            self.advance_to(start + int(timeout * 1e9))
+        return event.is_set()
+
+
+class SimulatedBackend(MockBackend):
+    """
+    pulse backend of simulated drivers on a virtual clock
+
+    a driver cannot follow pulses faster than max_rate (pulses per second),
+    such pulses are counted as lost per pin; the timeline is only recorded
+    if asked for
+    """
+
+    def __init__(self, clock=None, max_rate=200000, record=False):
+        super().__init__()
+        self.clock = clock or VirtualClock()
+        self.max_rate = max_rate
+        self.record = record
+        self.sent = Counter()
+        self.lost = Counter()
+        self._last = {}
+        self._lock = Lock()
+
+    def now(self):
+        return self.clock.now()
+
+    def train(self, pins, delays, timeline, masks=None, cancel=None):
+        min_delay = 1e9 / self.max_rate
+        now = max(self.clock.now(), timeline.deadline)
+        count = len(delays)
+        with self._lock:
+            for index, step_delay in enumerate(delays):
+                if cancel and cancel():
+                    count = index
+                    break
+                for j, pin in enumerate(pins):
+                    if masks is None or masks[index] >> j & 1:
+                        if now - self._last.get(pin, -min_delay) < min_delay:
+                            self.lost[pin] += 1
+                        self._last[pin] = now
+                        self.sent[pin] += 1
+                        if self.record:
+                            self.times.append(now)
+                            self.pins.append(pin)
+                now += step_delay
+        timeline.pulses += count
+        timeline.deadline = now
+        start = time.perf_counter_ns()
+        self.clock.advance_to(now)
+        timeline.slept += time.perf_counter_ns() - start
+        return count
+
+    def clear(self):
+        super().clear()
+        self.sent.clear()
+        self.lost.clear()
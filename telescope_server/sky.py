@@ -0,0 +1,236 @@
+# -*- encoding: utf-8 -*-
+# Copyright: Armin Leuprecht <mir@mur.at> and Stephan Burger <stephan101@gmx.de>
+# License: GNU GPL version 3; http://www.gnu.org/licenses/gpl.txt
+
+"""
+vectorised positions of the fixed stars
+
+the J2000 ra/dec of all stars (numpy arrays of a catalogue) are moved by
+their proper motions, precessed to the date and turned into altitudes in
+one pass by the sidereal time and latitude of the observer; nutation and
+aberration (less than an arc minute) are neglected
+
+cone and nearest queries are answered by a k-d tree of the unit vectors of
+the stars; the horizon cuts the sky in half, thus the visible stars are
+found by one vectorised pass over all of them
+"""
+
+# Third party
+import ephem
+import numpy as np
+
+# the stars hardly move within a day (proper motion, precession)
+UPDATE_INTERVAL = 1.0
+
+# objects on the horizon are lifted by refraction
+HORIZON = -34.0 / 60 * ephem.degree
+
+ARCSEC = ephem.degree / 3600
+MAS = ARCSEC / 1000
+
+
+def precess(ra, dec, date):
+    """
+    return the ra/dec (radians) of the J2000 ra/dec at the given date
+    (IAU 1976 precession)
+    """
+    t = (date - ephem.J2000) / 36525.0
+    zeta = (2306.2181 + (0.30188 + 0.017998 * t) * t) * t * ARCSEC
+    z = (2306.2181 + (1.09468 + 0.018203 * t) * t) * t * ARCSEC
+    theta = (2004.3109 - (0.42665 + 0.041833 * t) * t) * t * ARCSEC
+    cos_dec = np.cos(dec)
+    a = cos_dec * np.sin(ra + zeta)
+    b = np.cos(theta) * cos_dec * np.cos(ra + zeta) - np.sin(theta) * np.sin(dec)
+    c = np.sin(theta) * cos_dec * np.cos(ra + zeta) + np.cos(theta) * np.sin(dec)
+    return np.arctan2(a, b) + z, np.arcsin(np.clip(c, -1, 1))
+
+
+def unit_vectors(ra, dec):
+    """
+    return the unit vectors (rows) of the given ra/dec (radians)
+    """
+    cos_dec = np.cos(dec)
+    return np.column_stack([cos_dec * np.cos(ra), cos_dec * np.sin(ra), np.sin(dec)])
+
+
+def chord(angle):
+    """
+    return the distance of two unit vectors the given angle (radians) apart
+    """
+    return 2 * np.sin(min(angle, np.pi) / 2)
+
+
+class KDTree(object):
+    """
+    k-d tree of points (the rows of an array) for radius and nearest queries
+
+    the tree is implicit: the indices of the points are reordered such that
+    every node covers a contiguous range which is split at its median along
+    its widest dimension; ranges of up to leaf_size points are scanned at once
+    """
+
+    def __init__(self, points, leaf_size=16):
+        self.points = np.asarray(points, dtype=float)
+        self.leaf_size = leaf_size
+        self.order = np.arange(len(self.points))
+        # (start, stop) of the inner nodes: (dimension, split value, middle)
+        self._nodes = {}
+        ranges = [(0, len(self.points))]
+        while ranges:
+            start, stop = ranges.pop()
+            if stop - start <= leaf_size:
+                continue
+            indices = self.order[start:stop]
+            values = self.points[indices]
+            dim = int(np.argmax(values.max(axis=0) - values.min(axis=0)))
+            middle = (stop - start) // 2
+            part = np.argpartition(values[:, dim], middle)
+            self.order[start:stop] = indices[part]
+            self._nodes[start, stop] = (
+                dim,
+                values[part[middle], dim],
+                start + middle,
+            )
+            ranges += [(start, start + middle), (start + middle, stop)]
+
+    def __len__(self):
+        return len(self.points)
+
+    def radius(self, center, radius):
+        """
+        return the indices of the points within the radius of the center
+        """
+        found = []
+        ranges = [(0, len(self.points))]
+        while ranges:
+            start, stop = ranges.pop()
+            node = self._nodes.get((start, stop))
+            if node is None:
+                indices = self.order[start:stop]
+                distances = ((self.points[indices] - center) ** 2).sum(axis=1)
+                found.append(indices[distances <= radius * radius])
+                continue
+            dim, split, middle = node
+            if center[dim] - split <= radius:
+                ranges.append((start, middle))
+            if split - center[dim] <= radius:
+                ranges.append((middle, stop))
+        return np.sort(np.concatenate(found)) if found else self.order[:0]
+
+    def nearest(self, center):
+        """
+        return the index of the point nearest to the center (None if empty)
+        """
+        best = [np.inf, None]
+
+        def search(start, stop):
+            node = self._nodes.get((start, stop))
+            if node is None:
+                indices = self.order[start:stop]
+                if len(indices):
+                    distances = ((self.points[indices] - center) ** 2).sum(axis=1)
+                    i = distances.argmin()
+                    if distances[i] < best[0]:
+                        best[:] = distances[i], int(indices[i])
+                return
+            dim, split, middle = node
+            offset = center[dim] - split
+            near, far = (start, middle), (middle, stop)
+            if offset > 0:
+                near, far = far, near
+            search(*near)
+            if offset * offset < best[0]:
+                search(*far)
+
+        search(0, len(self.points))
+        return best[1]
+
+
+class StarField(object):
+    """
+    ra/dec of the fixed stars of a catalogue at the date of the observer
+    """
+
+    def __init__(self, catalogue):
+        self._catalogue = catalogue
+        self._date = None
+        self.ra = self.dec = None
+        # k-d trees of the stars brighter than a magnitude (None: all)
+        self._trees = {}
+
+    def __len__(self):
+        return len(self._catalogue)
+
+    def _update(self, date):
+        """
+        compute the ra/dec of the stars at the given date
+        """
+        stars = self._catalogue
+        years = (date - ephem.J2000) / 365.25
+        self.ra, self.dec = precess(
+            stars.ra + stars.pmra * MAS * years / np.cos(stars.dec),
+            stars.dec + stars.pmdec * MAS * years,
+            date,
+        )
+        self._sin_dec, self._cos_dec = np.sin(self.dec), np.cos(self.dec)
+        self._trees = {}
+        self._date = date
+
+    def _at(self, date):
+        """
+        make sure the positions are computed for the given date
+        """
+        if self._date is None or abs(date - self._date) > UPDATE_INTERVAL:
+            self._update(date)
+
+    def _tree(self, mag):
+        """
+        return the indices and the k-d tree of the stars brighter than mag
+        """
+        tree = self._trees.get(mag)
+        if tree is None:
+            if mag is None:
+                indices = np.arange(len(self._catalogue))
+            else:
+                indices = np.flatnonzero(self._catalogue.mag <= mag)
+            points = unit_vectors(self.ra[indices], self.dec[indices])
+            tree = self._trees[mag] = (indices, KDTree(points))
+        return tree
+
+    def altitudes(self, observer):
+        """
+        return the altitudes (radians, without refraction) of all stars
+        """
+        self._at(observer.date)
+        lat = observer.lat
+        hour_angle = observer.sidereal_time() - self.ra
+        return np.arcsin(
+            self._sin_dec * np.sin(lat)
+            + self._cos_dec * np.cos(lat) * np.cos(hour_angle)
+        )
+
+    def visible(self, observer):
+        """
+        return the indices of the stars above the horizon
+        """
+        return np.flatnonzero(self.altitudes(observer) > HORIZON)
+
+    def cone(self, date, ra, dec, radius, mag=None):
+        """
+        return the indices of the stars (brighter than mag) within the
+        radius (radians) around ra/dec of the date
+        """
+        self._at(date)
+        indices, tree = self._tree(mag)
+        center = unit_vectors(ra, dec)[0]
+        return indices[tree.radius(center, chord(radius))]
+
+    def nearest(self, date, ra, dec, mag=None):
+        """
+        return the index of the star (brighter than mag) nearest to ra/dec
+        of the date (None if there is none)
+        """
+        self._at(date)
+        indices, tree = self._tree(mag)
+        found = tree.nearest(unit_vectors(ra, dec)[0])
+        return None if found is None else int(indices[found])